@@ -20,6 +20,8 @@ st.markdown('''
 图表类型，然后上传特定格式的数据，即可绘制相关图表，绘制完之后点击下载即可。
 
 下载的图片格式以*SVG*矢量图为主，因为矢量图后期的编辑更加方便。如果需要，也可以选择*PNG*位图格式。
+需要导出多个图表时，可以把各个图表“加入导出清单”，再在侧边栏中点击“导出全部”，一次下载包含全部图表
+SVG和PNG图片的ZIP文件。
 ''')
 
 df = pd.DataFrame({
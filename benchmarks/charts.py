@@ -0,0 +1,272 @@
+'''
+测量各类图表从数据整理到导出图片的各阶段耗时和内存峰值。
+
+按assets目录中示例数据的列名和取值生成不同规模的合成专利记录（记录条数和类别数量
+可调，类别按Zipf分布抽样），对每种图表依次测量：
+
+* prep：把原始记录汇总为该图表示例数据的格式；
+* build：按页面中的绘图流程构建图表（不使用图表缓存）；
+* json：按streamlit的方式把图表序列化为JSON；
+* svg/png：通过页面使用的渲染进程池导出SVG和PNG图片（不经过导出缓存）。
+
+每个测试用例在独立的Python进程中运行，peak_rss_mb为该进程的内存峰值（不包括渲染进程），
+baseline_rss_mb为生成合成数据之后的内存占用；另外用tracemalloc单独执行一遍prep、build和
+json阶段（不计时），记录各阶段新分配内存的峰值*_peak_mb。结果以JSON格式输出，便于在不同提交之间比较：
+
+    python -m benchmarks.charts -o charts.json
+    python -m benchmarks.charts --charts sankey treemap --records 1000000 --categories 10000
+'''
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHARTS = [
+    'line_trend', 'area_trend', 'bar_trend',
+    'pie', 'treemap', 'sunburst', 'waterfall', 'dualbar',
+    'bar_rank',
+    'scatter_plot', 'scatter_pie', 'sankey',
+]
+RECORDS = [100, 10_000, 1_000_000]
+CATEGORIES = [10, 100, 1000, 10_000]
+FORMATS = ['svg', 'png']
+COUNT = '申请量(项)'
+
+
+def _rss_mb():
+    # Linux上ru_maxrss的单位为KB，macOS上为字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+def _timed(func, repeat=1):
+    '''执行func共repeat次，返回最后一次的结果和最短耗时(秒)'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, round(best, 4)
+
+
+def _peak_mb(func):
+    '''执行func，返回执行期间新分配内存的峰值(MB)'''
+    tracemalloc.start()
+    try:
+        func()
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def synthetic_records(n, k, seed=0):
+    '''生成n条合成专利记录，“类别”列共有k个取值，其余各列取值来自示例数据'''
+    import numpy as np
+    import pandas as pd
+
+    assets = os.path.join(ROOT, 'assets')
+    countries = list(pd.read_csv(os.path.join(assets, 'sankey.csv'), nrows=0).columns[1:])
+    bubble_pie = pd.read_csv(os.path.join(assets, 'bubble_pie.csv'))
+    applicants = list(bubble_pie.iloc[:, 1].unique())
+    effects = list(bubble_pie.columns[2:])
+
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, k + 1)
+    codes = rng.choice(k, size=n, p=weights / weights.sum())
+    names = np.array([f'类别{i:05d}' for i in range(k)], dtype=object)
+
+    return pd.DataFrame({
+        '年份': rng.integers(2004, 2024, size=n),
+        '类别': pd.Categorical.from_codes(codes, names),
+        '1级分支': pd.Categorical(np.char.add('1级分支', (codes // 100).astype(str))),
+        '2级分支': pd.Categorical(np.char.add('2级分支', (codes // 10).astype(str))),
+        '国家': pd.Categorical(rng.choice(countries, size=n)),
+        '目标国': pd.Categorical(rng.choice(countries, size=n)),
+        '申请人': pd.Categorical(rng.choice(applicants, size=n)),
+        '功效': pd.Categorical(rng.choice(effects, size=n)),
+    })
+
+
+def _wide(table, index, columns):
+    return (table.pivot_table(index=index, columns=columns, values=COUNT,
+                              aggfunc='sum', fill_value=0, observed=True)
+            .reset_index().rename_axis(columns=None))
+
+
+def prepare(chart, records):
+    '''把原始记录汇总为chart对应示例数据的格式，返回(数据, 图表设置)'''
+    from config.records import count_records
+
+    def count(by, **rename):
+        return count_records(records, by, COUNT).rename(columns=rename)
+
+    if chart in ('line_trend', 'area_trend', 'bar_trend'):
+        data = count(['年份', '类别'], 类别='地区')
+        return data, {'columns': {'x': '年份', 'y': COUNT, 'color': '地区'}}
+    if chart == 'pie':
+        data = count(['类别'], 类别='技术分支')
+        return data, {'columns': {'values': COUNT, 'names': '技术分支'}}
+    if chart in ('treemap', 'sunburst'):
+        data = count(['1级分支', '2级分支', '类别'], 类别='3级分支')
+        return data, {'columns': {'path': ['1级分支', '2级分支', '3级分支'],
+                                  'values': COUNT, 'color': '1级分支'}}
+    if chart == 'waterfall':
+        import pandas as pd
+        data = count(['类别']).rename(columns={COUNT: '数量'})
+        total = pd.DataFrame({'类别': ['总计'], '数量': [data['数量'].sum()]})
+        data = pd.concat([total, data.astype({'类别': object})], ignore_index=True)
+        return data, {'columns': {'x': '类别', 'y': '数量'},
+                      'options': {'color': '#4499FF', 'font_color': '#FFFFFF'}}
+    if chart == 'dualbar':
+        # 比较条形图要求两个申请人在每个技术领域都有数据
+        data = _wide(count(['类别', '申请人'], 类别='技术领域'), '技术领域', '申请人')
+        data = data.melt(id_vars='技术领域', value_vars=list(data.columns[1:3]),
+                         var_name='申请人', value_name=COUNT)
+        return data, {'columns': {'x': COUNT, 'y': '技术领域', 'cat': '申请人'}}
+    if chart == 'bar_rank':
+        data = count(['类别', '功效'], 类别='地区', 功效='分支')
+        return data, {'columns': {'x': '地区', 'y': COUNT, 'color': '分支'}}
+    if chart == 'scatter_plot':
+        data = _wide(count(['类别', '国家'], 类别='2级技术分支'), '2级技术分支', '国家')
+        return data, {'columns': {'x': '2级技术分支', 'y': list(data.columns[1:])}}
+    if chart == 'scatter_pie':
+        data = _wide(count(['类别', '申请人', '功效'], 类别='3级技术分支', 申请人='当前第1申请人'),
+                     ['3级技术分支', '当前第1申请人'], '功效')
+        return data, {'columns': {'x': '3级技术分支', 'y': list(data.columns[2:]),
+                                  'cat': '当前第1申请人'}}
+    if chart == 'sankey':
+        data = count(['类别', '国家', '目标国'], 类别='申请人', 国家='来源国')
+        return data, {'options': {'stages': ['申请人', '来源国', '目标国'], 'value': COUNT}}
+    raise ValueError(f'未知的图表类型：{chart}')
+
+
+def measure(chart, n, k, formats=FORMATS, repeat=1):
+    '''在当前进程中测量单个图表在n条记录、k个类别时各阶段的耗时'''
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    import plotly.io as pio
+    from charts.batch import build_figure
+    from charts.memo import figure_cache
+    from config.export import render_image, savefig_bytes
+
+    records = synthetic_records(n, k)
+    baseline = _rss_mb()
+    result = {'chart': chart, 'records': n, 'categories': k,
+              'distinct_categories': int(records['类别'].nunique())}
+
+    (data, spec), result['prep_s'] = _timed(lambda: prepare(chart, records), repeat)
+    spec = {'type': chart, 'width': 800, **spec}
+    result['rows'] = len(data)
+
+    def build():
+        figure_cache.clear()
+        return build_figure(data, spec)
+
+    # 先不计时地构建一次，导入图表模块和plotly express的耗时不计入构建耗时
+    build()
+    fig, result['build_s'] = _timed(build, repeat)
+
+    if chart == 'scatter_pie':
+        result['json_s'] = result['json_bytes'] = None
+        export = lambda ext: savefig_bytes(fig, ext, dpi=300)
+    else:
+        fig_json, result['json_s'] = _timed(lambda: pio.to_json(fig, validate=False), repeat)
+        result['json_bytes'] = len(fig_json)
+        # 先渲染一个空白图表启动渲染进程，不计入导出耗时
+        render_image('{"data": [], "layout": {}}', 'png')
+        export = lambda ext: render_image(fig_json, ext, scale=1 if ext == 'svg' else 3)
+
+    for ext in formats:
+        image, result[f'{ext}_s'] = _timed(lambda: export(ext), repeat)
+        result[f'{ext}_bytes'] = len(image)
+
+    result['prep_peak_mb'] = _peak_mb(lambda: prepare(chart, records))
+    result['build_peak_mb'] = _peak_mb(build)
+    if chart != 'scatter_pie':
+        result['json_peak_mb'] = _peak_mb(lambda: pio.to_json(fig, validate=False))
+
+    result['baseline_rss_mb'] = baseline
+    result['peak_rss_mb'] = _rss_mb()
+    return result
+
+
+def _commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='测量各类图表的绘制和导出耗时')
+    parser.add_argument('-o', '--output', help='结果JSON文件，默认输出到标准输出')
+    parser.add_argument('--charts', nargs='+', choices=CHARTS, default=CHARTS,
+                        help='要测量的图表类型，默认为全部图表')
+    parser.add_argument('--records', nargs='+', type=int, default=RECORDS,
+                        help='合成记录条数，默认为%(default)s')
+    parser.add_argument('--categories', nargs='+', type=int, default=CATEGORIES,
+                        help='类别数量，超过记录条数的组合会被跳过，默认为%(default)s')
+    parser.add_argument('--formats', nargs='*', choices=FORMATS, default=FORMATS,
+                        help='导出的图片格式，不指定格式时不测量导出')
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+                        help='每个阶段重复的次数，结果取最短耗时')
+    parser.add_argument('--timeout', type=float, default=1800,
+                        help='单个测试用例的超时时间(秒)')
+    parser.add_argument('--case', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        chart, n, k = args.case
+        result = measure(chart, int(n), int(k), args.formats, args.repeat)
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+
+    results = []
+    for chart in args.charts:
+        for n in args.records:
+            for k in args.categories:
+                if k > n:
+                    continue
+                print(f'{chart} records={n} categories={k}', file=sys.stderr)
+                command = [sys.executable, '-m', 'benchmarks.charts', '--case', chart,
+                           str(n), str(k), '--repeat', str(args.repeat),
+                           '--formats', *args.formats]
+                case = {'chart': chart, 'records': n, 'categories': k}
+                try:
+                    out = subprocess.run(command, cwd=ROOT, capture_output=True, text=True,
+                                         timeout=args.timeout)
+                except subprocess.TimeoutExpired:
+                    results.append({**case, 'error': 'timeout'})
+                    continue
+                if out.returncode != 0:
+                    error = out.stderr.strip().splitlines()
+                    results.append({**case, 'error': error[-1] if error else 'failed'})
+                    continue
+                results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    report = json.dumps({
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'commit': _commit(),
+        'results': results,
+    }, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
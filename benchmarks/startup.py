@@ -0,0 +1,80 @@
+'''
+测量各页面的冷启动耗时（首次渲染时间）。
+
+每个页面在独立的Python进程中用streamlit.testing的AppTest执行一次，分别记录导入
+config模块的耗时和页面首次完整执行的耗时，并检查是否提前导入了matplotlib。结果以
+JSON格式输出，便于在不同提交之间比较：
+
+    python -m benchmarks.startup -o startup.json
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = [
+    'Home.py',
+    'pages/1_Trend.py',
+    'pages/2_Category.py',
+    'pages/3_Rank.py',
+    'pages/4_Utilities.py',
+]
+
+
+def measure(page):
+    '''在当前进程中测量单个页面的首次渲染耗时'''
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    start = time.perf_counter()
+    import config.config  # noqa: F401
+    import_time = time.perf_counter() - start
+
+    from streamlit.testing.v1 import AppTest
+    start = time.perf_counter()
+    at = AppTest.from_file(os.path.join(ROOT, page), default_timeout=120).run()
+    render_time = time.perf_counter() - start
+
+    return {
+        'page': page,
+        'config_import_s': round(import_time, 4),
+        'first_render_s': round(render_time, 4),
+        'matplotlib_loaded': 'matplotlib' in sys.modules,
+        'exceptions': [str(e.value) for e in at.exception],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='测量各页面的冷启动耗时')
+    parser.add_argument('-o', '--output', help='结果JSON文件，默认输出到标准输出')
+    parser.add_argument('--page', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.page:
+        print(json.dumps(measure(args.page), ensure_ascii=False))
+        return 0
+
+    results = []
+    for page in PAGES:
+        # 每个页面使用新的进程，保证测到的是冷启动耗时
+        out = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.startup', '--page', page],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    report = json.dumps({'python': sys.version.split()[0], 'results': results},
+                        ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
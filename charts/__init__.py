@@ -0,0 +1,25 @@
+'''
+专利分析图表的绘图函数，可以脱离streamlit界面单独使用。
+'''
+from charts.trend import line_trend, area_trend, bar_trend
+from charts.category import pie, treemap, sunburst, waterfall, dualbar
+from charts.rank import bar_rank, top_n, rank_table, style_rank_axes
+from charts.utilities import (
+    scatter_plot, melt_bubble, bubble_orders, scatter_pie, hex2rgba,
+    sankey_flows, sankey,
+)
+
+CHARTS = {
+    'line_trend': line_trend,
+    'area_trend': area_trend,
+    'bar_trend': bar_trend,
+    'pie': pie,
+    'treemap': treemap,
+    'sunburst': sunburst,
+    'waterfall': waterfall,
+    'dualbar': dualbar,
+    'bar_rank': bar_rank,
+    'scatter_plot': scatter_plot,
+    'scatter_pie': scatter_pie,
+    'sankey': sankey,
+}
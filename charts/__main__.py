@@ -0,0 +1,30 @@
+'''
+批量绘图命令行：
+
+    python -m charts manifest.yaml -o output -j 4
+'''
+import argparse
+import sys
+
+from charts.batch import load_manifest, run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m charts', description='根据图表清单批量绘制并导出图表')
+    parser.add_argument('manifest', help='YAML或JSON格式的图表清单')
+    parser.add_argument('-o', '--output', default='output', help='输出目录，默认为output')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='并行进程数，默认为CPU核心数')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='忽略输入指纹，重新绘制所有图表')
+    args = parser.parse_args(argv)
+
+    specs = load_manifest(args.manifest)
+    done, skipped, failed = run(specs, args.output, jobs=args.jobs, force=args.force)
+    print(f'共{len(specs)}个图表：绘制{done}个，跳过{skipped}个，失败{failed}个')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
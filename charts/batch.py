@@ -0,0 +1,211 @@
+'''
+根据图表清单批量绘制并导出图表。
+
+清单为YAML或JSON文件，格式如下（defaults中的设置会被每个图表继承）：
+
+    defaults:
+      width: 800
+      height: 494
+      margin: {t: 100, b: 80, l: 80, r: 80}
+      format: svg
+      fonts: embed    # SVG图片的字体处理方式：embed、path或none
+    charts:
+      - name: 申请趋势
+        data: assets/trend_multi.csv
+        type: line_trend
+        columns: {x: 年份, y: 申请量(项), color: 地区}
+      - data: assets/rank_multi.csv
+        sheet: Sheet1
+        type: bar_rank
+        columns: {x: 地区, y: 申请量(项), color: 分支}
+        options: {barmode: group}
+      - data: assets/trend_multi.csv
+        type: line_trend
+        columns: {x: 年份, y: 申请量(项)}
+        options: {facet: 地区, facet_cols: 2}    # 按地区绘制共用坐标轴的子图
+
+各图表在多个进程中并行绘制，使用与页面相同的mytheme模板。输出目录中记录了每个图表的
+输入指纹（数据文件内容和图表设置），输入没有变化的图表会被跳过。
+'''
+import os
+import json
+import hashlib
+import functools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import config
+from config.cache import digest
+from config.loader import read_data
+
+STATE_FILE = '.patentvis-batch.json'
+
+
+def load_manifest(path):
+    '''读取YAML或JSON格式的图表清单，返回合并了默认设置的图表列表'''
+    with open(path, 'rb') as file:
+        text = file.read().decode('utf-8')
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit('读取YAML清单需要安装PyYAML，也可以改用JSON格式的清单')
+        manifest = yaml.safe_load(text)
+    else:
+        manifest = json.loads(text)
+
+    defaults = manifest.get('defaults', {})
+    base = os.path.dirname(os.path.abspath(path))
+    specs = []
+    for i, chart in enumerate(manifest['charts']):
+        spec = {**defaults, **chart}
+        spec['data'] = os.path.join(base, spec['data'])
+        spec.setdefault('name', f'{i+1:03d}_{spec["type"]}')
+        specs.append(spec)
+    return specs
+
+
+def fingerprint(spec):
+    '''由数据文件内容和图表设置计算输入指纹'''
+    with open(spec['data'], 'rb') as file:
+        content = file.read()
+    h = hashlib.sha256(digest(content).encode('ascii'))
+    h.update(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return h.hexdigest()
+
+
+def build_figure(data, spec):
+    '''按图表设置绘制图表，与页面中的绘图流程保持一致'''
+    from charts import CHARTS, rank_table, style_rank_axes, melt_bubble, bubble_orders
+
+    chart = spec['type']
+    columns = dict(spec.get('columns', {}))
+    options = dict(spec.get('options', {}))
+    width = spec.get('width', config.width)
+    height = spec.get('height', 0.618*width)
+    facet = options.get('facet')
+    if facet is not None and 'height' not in spec:
+        from charts.facet import facet_height
+        count = min(data[facet].nunique(), config.facet_max)
+        height = facet_height(count, options.get('facet_cols', config.facet_cols), height)
+
+    if chart == 'bar_rank':
+        reverse_axis = options.pop('reverse_axis', False)
+        is_vertical = options.pop('is_vertical', False)
+        color = columns.get('color')
+        if options.pop('normalize_names', False):
+            from config.names import normalize_names
+            data, _ = normalize_names(data, columns['x'], columns['y'])
+        data, xval, yval = rank_table(
+            data, columns['x'], columns['y'], color, is_vertical,
+            top=options.pop('top', None), others=options.pop('others', False), facet=facet,
+        )
+        fig = CHARTS[chart](data, xval, yval, is_vertical=is_vertical,
+                            width=width, height=height, **options)
+        fig.update_layout(legend_title=color or '')
+        style_rank_axes(fig, is_vertical, reverse_axis, columns['y'])
+    elif chart == 'scatter_plot':
+        orders = bubble_orders(data, columns['x'], columns['y'])
+        data = melt_bubble(data, columns['x'], columns['y'])
+        fig = CHARTS[chart](data, x=columns['x'], y='variable', size='value',
+                            category_orders=orders, width=width, height=height,
+                            **options)
+        fig.update_layout(xaxis_title_text='', yaxis_title_text='')
+    elif chart == 'sankey':
+        fig = CHARTS[chart](data, width=width, height=height, **options)
+    elif chart == 'waterfall':
+        fig = CHARTS[chart](data, **columns, **options)
+        fig.update_layout(width=width, height=height)
+    else:
+        fig = CHARTS[chart](data, **columns, **options, width=width, height=height)
+
+    if chart == 'scatter_pie':
+        return fig
+
+    margin = {'t': 100, 'b': 80, 'l': 80, 'r': 80, **spec.get('margin', {})}
+    fig.update_layout(
+        margin_autoexpand=True,
+        yaxis_automargin=True,
+        xaxis_automargin=True,
+        margin_t=margin['t'], margin_b=margin['b'],
+        margin_l=margin['l'], margin_r=margin['r'],
+    )
+    if chart not in ('pie', 'treemap', 'sunburst', 'sankey'):
+        fig.update_layout(plot_bgcolor='white')
+    if chart in ('line_trend', 'area_trend', 'bar_trend'):
+        fig.update_layout(xaxis_tickmode='linear')
+    return fig
+
+
+@functools.lru_cache(maxsize=8)
+def _read(path, sheet, mtime):
+    with open(path, 'rb') as file:
+        return read_data(file.read(), sheet)
+
+
+def render_chart(spec, output):
+    '''绘制单个图表并写入输出目录，返回输出文件路径'''
+    ext = spec.get('format', 'svg')
+    data = _read(spec['data'], spec.get('sheet'), os.path.getmtime(spec['data']))
+    fig = build_figure(data, spec)
+
+    if spec['type'] == 'scatter_pie':
+        from config.export import savefig_bytes
+        image = savefig_bytes(fig, ext, dpi=spec.get('dpi', 300))
+    else:
+        import plotly.io as pio
+        from config.export import static_figure
+        scale = spec.get('scale', 1 if ext == 'svg' else 3)
+        image = pio.to_image(static_figure(fig.to_dict()), format=ext, scale=scale)
+        if ext == 'svg':
+            from config.fonts import finish_svg
+            image = finish_svg(image, spec.get('fonts'))
+
+    path = os.path.join(output, f'{spec["name"]}.{ext}')
+    with open(path, 'wb') as file:
+        file.write(image)
+    return path
+
+
+def run(specs, output, jobs=None, force=False):
+    '''并行绘制清单中的图表，返回(已绘制, 已跳过, 失败)的图表数量'''
+    os.makedirs(output, exist_ok=True)
+    state_path = os.path.join(output, STATE_FILE)
+    try:
+        with open(state_path, encoding='utf-8') as file:
+            state = json.load(file)
+    except (FileNotFoundError, ValueError):
+        state = {}
+
+    todo = {}
+    skipped = 0
+    for spec in specs:
+        fp = fingerprint(spec)
+        out = os.path.join(output, f'{spec["name"]}.{spec.get("format", "svg")}')
+        if not force and state.get(spec['name']) == fp and os.path.exists(out):
+            skipped += 1
+            continue
+        todo[spec['name']] = (spec, fp)
+
+    done = failed = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(render_chart, spec, output): name
+                for name, (spec, _) in todo.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    path = future.result()
+                except Exception as e:
+                    failed += 1
+                    state.pop(name, None)
+                    print(f'[失败] {name}: {e!r}')
+                    continue
+                done += 1
+                state[name] = todo[name][1]
+                print(f'[完成] {path}')
+
+    with open(state_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file, ensure_ascii=False, indent=2)
+    return done, skipped, failed
@@ -0,0 +1,272 @@
+'''
+构成类图表：饼图、树形图、多环图、瀑布图和比较条形图。
+'''
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from config import config
+from charts.memo import memoize_figure
+
+
+@memoize_figure
+def pie(data, values, names, insidelabel=False, is_hole=False,
+        width=config.width, height=config.width):
+    fig = px.pie(data, values=values, names=names, width=width, height=height)
+    fig.update_traces(
+        direction='clockwise',
+        textfont_family=config.font, textfont_size=config.size-2,
+    )
+    if insidelabel:
+        fig.update_traces(
+            textposition='inside', textinfo='percent+label',
+            showlegend=False,)
+    if is_hole:
+        fig.update_traces(hole=0.4)
+    return fig
+
+
+def _group_extremes(groups, values, size):
+    '''按groups分组求values的最小值和最大值，groups为0到size-1的整数'''
+    order = np.argsort(groups, kind='stable')
+    starts = np.searchsorted(groups[order], np.arange(size))
+    return (np.minimum.reduceat(values[order], starts),
+            np.maximum.reduceat(values[order], starts))
+
+
+def hierarchy(data, path, values=None, color=None, maxdepth=None,
+              threshold=0.0, other='其他'):
+    '''由层级路径列构建树形图和多环图的节点。
+
+    data为“长”数据格式，path为按1级、2级……顺序排列的路径列，values为数值列（为None时按
+    记录计数）。某一级为空值的记录在该级截断，作为上一级的叶节点；maxdepth限制保留的层级
+    数，更深层级的数值累加到上级节点。每个父节点下数值低于总量threshold比例的多个子节点
+    （连同其下级）合并为一个“其他”节点。
+
+    返回节点的id、标签、父节点id、数值和颜色数组。color为数值列时节点颜色为按数值加权的
+    平均值；为类别列时节点颜色为该类别，下级包含多个类别的节点为“(?)”；color为None时
+    颜色数组也为None。
+    '''
+    path = list(path[:maxdepth] if maxdepth else path)
+    levels = data[path]
+    # 每条记录的层级数：路径在第一个空值处截断
+    depth = np.cumprod(levels.notna().to_numpy(), axis=1).sum(axis=1)
+    weights = (np.ones(len(data)) if values is None
+               else pd.to_numeric(data[values]).fillna(0).to_numpy(dtype=float))
+    total = weights.sum()
+
+    continuous = color is not None and pd.api.types.is_numeric_dtype(data[color])
+    if continuous:
+        color_values = data[color].to_numpy(dtype=float)
+    elif color is not None:
+        color_codes, color_labels = pd.factorize(data[color].astype(str))
+
+    ids, labels, parents, node_values, node_colors = [], [], [], [], []
+    prefix = np.zeros(len(data), dtype=np.int64)
+    parent_ids = np.array([''], dtype=object)
+    for k, column in enumerate(path):
+        active = np.flatnonzero(depth > k)
+        if not len(active):
+            break
+        code, uniques = pd.factorize(levels[column])
+        uniques = np.append(np.asarray(uniques.astype(str), dtype=object), other)
+        code, width = code[active].astype(np.int64), len(uniques)
+        # 节点由(父节点, 本级标签)唯一确定，同一父节点下的同名标签合并
+        key = prefix[active]*width + code
+        nodes, inverse = np.unique(key, return_inverse=True)
+        inverse = inverse.ravel()
+        flow = np.bincount(inverse, weights=weights[active], minlength=len(nodes))
+
+        small = flow < threshold*total
+        if small.any():
+            parent = nodes // width
+            count = np.bincount(parent[small], minlength=parent.max() + 1)[parent]
+            # 同一父节点下只有一个小节点时保持原样；子节点全部为小节点时父节点直接作为叶节点
+            small &= count > 1
+            dropped = small & (count == np.bincount(parent, minlength=parent.max() + 1)[parent])
+            if k == 0:
+                # 第1级没有父节点，全部为小节点时保持原样
+                small &= ~dropped
+                dropped[:] = False
+        if small.any():
+            rows = small[inverse]
+            depth[active[rows]] = np.where(dropped[inverse[rows]], k, k + 1)
+            code[rows] = width - 1
+            kept = depth[active] > k
+            active, code = active[kept], code[kept]
+            key = prefix[active]*width + code
+            nodes, inverse = np.unique(key, return_inverse=True)
+            inverse = inverse.ravel()
+            flow = np.bincount(inverse, weights=weights[active], minlength=len(nodes))
+
+        parent = parent_ids[nodes // width]
+        label = uniques[nodes % width]
+        node_id = label if k == 0 else parent + '/' + label
+        ids.append(node_id)
+        labels.append(label)
+        parents.append(parent if k else np.full(len(nodes), '', dtype=object))
+        node_values.append(flow)
+
+        if continuous:
+            weighted = np.bincount(inverse, weights=weights[active]*color_values[active],
+                                   minlength=len(nodes))
+            node_colors.append(np.divide(weighted, flow, out=np.full(len(nodes), np.nan),
+                                         where=flow != 0))
+        elif color is not None:
+            low, high = _group_extremes(inverse, color_codes[active], len(nodes))
+            node_colors.append(np.where(low == high, color_labels.to_numpy(dtype=object)[low],
+                                        '(?)'))
+
+        prefix[active] = inverse
+        parent_ids = node_id
+
+    return (np.concatenate(ids), np.concatenate(labels), np.concatenate(parents),
+            np.concatenate(node_values),
+            np.concatenate(node_colors) if color is not None else None)
+
+
+def _hierarchy_trace(trace, data, path, values, color, labels, maxdepth, threshold, colors):
+    '''由hierarchy()的结果直接构建go.Treemap或go.Sunburst图表'''
+    ids, names, parents, node_values, node_color = hierarchy(
+        data, path, values, color, maxdepth, threshold)
+
+    layout = {}
+    if node_color is None:
+        marker, hovertemplate, customdata = {}, '', None
+    elif node_color.dtype == object:
+        # 类别颜色按出现顺序取色，包含多个类别的节点使用第1种颜色
+        categories = list(dict.fromkeys(node_color))
+        if '(?)' in categories:
+            categories.remove('(?)')
+            categories.insert(0, '(?)')
+        colormap = {c: colors[i % len(colors)] for i, c in enumerate(categories)}
+        marker = {'colors': [colormap[c] for c in node_color]}
+        hovertemplate, customdata = f'<br>{color}=%{{customdata}}', node_color
+    else:
+        marker = {'colors': node_color, 'coloraxis': 'coloraxis'}
+        hovertemplate, customdata = f'<br>{color}=%{{color}}', None
+        layout['coloraxis_colorbar_title_text'] = color
+
+    fig = go.Figure(trace(
+        ids=ids, labels=names, parents=parents, values=node_values,
+        branchvalues='total', marker=marker, customdata=customdata,
+        hovertemplate=(f'%{{label}}<br>{values or "计数"}=%{{value}}'
+                       f'{hovertemplate}<extra></extra>'),
+        textinfo='+'.join(labels) if labels is not None else None,
+    ))
+    fig.update_layout(margin_t=60, **layout)
+    return fig
+
+
+@memoize_figure
+def treemap(data, path, values, color, labels=None, maxdepth=None, threshold=0.0,
+            colors=px.colors.qualitative.Plotly,
+            width=config.width, height=config.width):
+    fig = _hierarchy_trace(go.Treemap, data, path, values, color, labels,
+                           maxdepth, threshold, colors)
+    fig.update_layout(width=width, height=height)
+    return fig
+
+
+@memoize_figure
+def sunburst(data, path, values, color, labels=None, maxdepth=None, threshold=0.0,
+             colors=px.colors.qualitative.Plotly,
+             width=config.width, height=config.width):
+    fig = _hierarchy_trace(go.Sunburst, data, path, values, color, labels,
+                           maxdepth, threshold, colors)
+    fig.update_layout(width=width, height=height)
+    return fig
+
+
+@memoize_figure
+def waterfall(data, x, y, color, font_color):
+    fig = go.Figure()
+    fig.add_trace(go.Waterfall(
+        orientation='v', 
+        x=data[x], y=[v if i==0 else -v for i, v in enumerate(data[y])],
+        measure=['absolute'] + ['relative']*(len(data[y])-1),
+        text=[f'{i:.0f}' for i in data[y]], textposition='auto',
+        totals_marker_color=color,
+        decreasing_marker_color=color,
+        textfont_color=font_color,
+        textfont_family=config.font, textfont_size=config.size-2,
+    ))
+    fig.update_layout(
+        yaxis_title_text=y,
+    )
+    return fig
+
+
+@memoize_figure
+def dualbar(df, x, y, cat, space=50, autorange=None,
+            width=config.width, height=config.width):
+    cat_data = np.unique(df[cat])
+    left_cat = df[cat] == cat_data[0]
+    right_cat = df[cat] == cat_data[1]
+
+    left_data = df.loc[left_cat, :]
+    right_data = df.loc[right_cat, :]
+
+    size = len(left_data[x])
+
+    fig = go.Figure(data=[
+        # go.Bar(
+        #     x=[space]*size, y=left_data[y], 
+        #     marker_color='white', marker_line_color='white',
+        #     orientation='h', showlegend=False,
+        # ),
+        go.Bar(
+            name=cat_data[0], x=left_data[x], y=left_data[y], 
+            orientation='h', base=[space]*size,
+            text=left_data[x], textposition='outside',
+            textfont_family=config.font, textfont_size=config.size-2,
+        ),
+        # go.Bar(
+        #     x=[-space]*size, y=right_data[y], 
+        #     marker_color='white', marker_line_color='white',
+        #     orientation='h', showlegend=False,
+        # ),
+        go.Bar(
+            name=cat_data[1], x=-right_data[x], y=right_data[y], 
+            orientation='h', base=[-space]*size,
+            text=right_data[x], textposition='outside',
+            textfont_family=config.font, textfont_size=config.size-2,
+        ),
+        
+        go.Scatter(
+            x=[0]*size, y=left_data[y],
+            mode='text', text=left_data[y],
+            showlegend=False,
+        ),
+    ])
+    # Change the bar mode
+    fig.update_layout(
+        barmode='relative',
+        xaxis=dict(
+            showgrid=False,
+            showline=False,
+            showticklabels=False,
+            automargin='height+top',
+            zeroline=False,
+        ),
+        yaxis=dict(
+            showgrid=False,
+            showline=False,
+            showticklabels=False,
+            autorange=autorange,
+        ),
+        paper_bgcolor='white',
+        plot_bgcolor='white',
+        width=width, height=height,
+    )
+
+    fig.add_annotation(
+        x=1, y=1.1, 
+        xref='x domain', yref='y domain',
+        text=x,
+        showarrow=False,
+        font_family=config.font, font_size=config.size-2,
+        # align='right', valign='bottom',
+    )
+    return fig
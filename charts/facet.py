@@ -0,0 +1,131 @@
+'''
+分面（small multiples）：按某一列的取值把同一份数据拆分为多个共用坐标轴的子图。
+
+数据只按分面列分组一次，各分面按数值合计降序排列，最多保留config.facet_max个。
+split_facets()从已构建的分面图表中拆出每个分面的单独图表，单独导出各分面时无需重新
+分组和构建图表。
+'''
+import math
+
+from config import config
+
+# 分面子图之间的间距（占整个绘图区域的比例）
+FACET_SPACING = 0.08
+
+
+def _ranked(groups, value, limit):
+    '''按value列的合计（value为None时按行数）降序排列的分面取值，最多limit个'''
+    limit = config.facet_max if limit is None else limit
+    totals = groups[value].sum() if value is not None else groups.size()
+    return list(totals.sort_values(ascending=False, kind='stable').index[:limit])
+
+
+def facet_groups(data, facet, value=None, limit=None):
+    '''按facet列把data分组一次，返回[(分面取值, 子表)]。
+
+    各分面按value列的合计（value为None时按行数）降序排列，最多保留limit个（默认为
+    config.facet_max）。
+    '''
+    groups = data.groupby(facet, sort=False, observed=True)
+    indices = groups.indices
+    return [(key, data.take(indices[key])) for key in _ranked(groups, value, limit)]
+
+
+def facet_height(count, cols, height):
+    '''分面图表的总高度：每行子图至少config.facet_row_height像素，且不低于height'''
+    rows = math.ceil(count / max(cols, 1)) if count else 1
+    return max(height, rows * config.facet_row_height)
+
+
+def facet_kwargs(facet, order, cols):
+    '''plotly express绘制分面图表的参数'''
+    return {
+        'facet_col': facet, 'facet_col_wrap': cols,
+        'category_orders': {facet: order},
+        'facet_row_spacing': FACET_SPACING, 'facet_col_spacing': FACET_SPACING / 2,
+    }
+
+
+def finish_facets(fig):
+    '''分面标题只显示分面取值，去掉plotly express添加的“列名=”前缀'''
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split('=', 1)[-1]))
+    return fig
+
+
+def _axis_names(trace):
+    return ('xaxis' + trace.get('xaxis', 'x')[1:], 'yaxis' + trace.get('yaxis', 'y')[1:])
+
+
+def _facet_title(annotations, xdomain, ydomain):
+    '''找出位于子图上方正中的分面标题'''
+    best, distance = None, None
+    for annotation in annotations:
+        if annotation.get('xref') != 'paper' or annotation.get('yref') != 'paper':
+            continue
+        x, y = annotation.get('x', 0.5), annotation.get('y', 1)
+        if not xdomain[0] <= x <= xdomain[1]:
+            continue
+        d = abs(y - ydomain[1]) + abs(x - (xdomain[0] + xdomain[1]) / 2)
+        if distance is None or d < distance:
+            best, distance = annotation, d
+    return best
+
+
+def split_facets(spec, width=None, height=None):
+    '''把分面图表字典拆分为每个分面一个图表字典，返回[(分面标题, 图表字典)]。
+
+    不是分面图表时返回只包含原图表的列表。拆出的图表各自调整坐标轴范围，尺寸为
+    width×height（默认沿用原图表的尺寸）。
+    '''
+    layout = spec.get('layout', {})
+    subplots = {}
+    for trace in spec.get('data', ()):
+        subplots.setdefault(_axis_names(trace), []).append(trace)
+    if len(subplots) < 2:
+        return [(layout.get('title', {}).get('text', ''), spec)]
+
+    annotations = layout.get('annotations', ())
+    base = {key: value for key, value in layout.items()
+            if not key.startswith(('xaxis', 'yaxis')) and key != 'annotations'}
+    if width is not None:
+        base['width'] = width
+    if height is not None:
+        base['height'] = height
+
+    axes = {}
+    for xname, yname in subplots:
+        xaxis = {k: v for k, v in layout.get(xname, {}).items() if k not in ('anchor', 'matches')}
+        yaxis = {k: v for k, v in layout.get(yname, {}).items() if k not in ('anchor', 'matches')}
+        title = _facet_title(annotations, xaxis.get('domain', [0, 1]), yaxis.get('domain', [0, 1]))
+        axes[xname, yname] = xaxis, yaxis, title
+    # 分面标题以外的注释保留在每个图表中
+    titles = [id(title) for *_, title in axes.values() if title is not None]
+    extra = [annotation for annotation in annotations if id(annotation) not in titles]
+
+    figures = []
+    for names, traces in subplots.items():
+        xaxis, yaxis, title = axes[names]
+        name = title['text'] if title else ''
+        xaxis.update(domain=[0, 1], showticklabels=True)
+        yaxis.update(domain=[0, 1], showticklabels=True)
+        # 分面图表中只有部分子图显示坐标轴标题，单独的图表统一使用第一个子图的标题
+        for axis, first in ((xaxis, layout.get('xaxis', {})), (yaxis, layout.get('yaxis', {}))):
+            if not axis.get('title', {}).get('text'):
+                axis['title'] = first.get('title', {})
+        figures.append((name, {
+            'data': [{**{k: v for k, v in trace.items() if k != 'showlegend'},
+                      'xaxis': 'x', 'yaxis': 'y'} for trace in traces],
+            'layout': {**base, 'xaxis': xaxis, 'yaxis': yaxis, 'annotations': extra,
+                       'title': {**base.get('title', {}), 'text': name}},
+        }))
+    return figures
+
+
+def export_facets(fig, ext, width=None, height=None, fonts=None):
+    '''把分面图表的每个分面导出为单独的ext格式图片，打包为ZIP文件，返回其字节串'''
+    import plotly.graph_objects as go
+    from config.export import export_bundle
+
+    items = [(str(name) or f'分面{i}', go.Figure(spec, _validate=False))
+             for i, (name, spec) in enumerate(split_facets(fig.to_dict(), width, height), 1)]
+    return export_bundle(items, formats=(ext,), fonts=fonts)
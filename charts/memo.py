@@ -0,0 +1,112 @@
+'''
+图表构建结果的缓存。
+
+Streamlit每次交互都会重新执行页面脚本，只调整图像尺寸或页边空白时，plotly express
+也要重新分组数据、生成并校验全部trace。memoize_figure按(数据指纹, 图表函数, 列映射和
+图表选项)缓存构建好的图表字典，命中时不经校验直接还原为新的Figure，再把宽度和高度作为
+布局补丁应用上去；页面随后的update_layout同样只修改布局。每次返回的Figure都是独立的
+副本，不同会话之间以及延迟导出时互不影响。
+'''
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from config import config
+from config.timing import stage
+
+# 只影响布局的参数，不作为缓存键的一部分
+LAYOUT_ARGS = ('width', 'height')
+
+
+def data_fingerprint(data):
+    '''计算DataFrame内容（包括列名、数据类型和索引）的哈希值'''
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((list(data.columns), [str(t) for t in data.dtypes])).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _freeze(value):
+    '''把列表、字典、Index和数组等参数转换为可哈希的元组，作为缓存键的一部分'''
+    if isinstance(value, dict):
+        return tuple((k, _freeze(v)) for k, v in sorted(value.items()))
+    if isinstance(value, (list, tuple, pd.Index, pd.Series, np.ndarray)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class FigureCache:
+    '''按条目数量限制的图表字典LRU缓存'''
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, spec):
+        with self._lock:
+            self._items[key] = spec
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return spec
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+figure_cache = FigureCache(config.figure_cache_size)
+
+
+def memoize_figure(chart):
+    '''缓存plotly图表函数的构建结果，函数的第一个参数为DataFrame。
+
+    width和height只作为布局补丁应用在缓存图表的副本上，改变它们不会重新构建图表。
+    数据无法计算哈希值（例如单元格中包含列表）时直接构建，不使用缓存。
+    '''
+    signature = inspect.signature(chart)
+
+    @wraps(chart)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        options = dict(bound.arguments)
+        data = options.pop(next(iter(signature.parameters)))
+        layout = {name: options.pop(name) for name in LAYOUT_ARGS if name in options}
+
+        try:
+            key = (chart.__module__, chart.__qualname__, data_fingerprint(data),
+                   _freeze(options))
+            hash(key)
+        except TypeError:
+            with stage('build', chart=chart.__name__, cached=False):
+                return chart(*args, **kwargs)
+
+        with stage('build', chart=chart.__name__) as info:
+            spec = figure_cache.get(key)
+            info['cached'] = spec is not None
+            if spec is None:
+                spec = figure_cache.put(key, chart(*args, **kwargs).to_dict())
+            fig = go.Figure(spec, _validate=False)
+            if layout:
+                fig.update_layout(**layout)
+        return fig
+
+    return wrapper
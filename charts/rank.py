@@ -0,0 +1,124 @@
+'''
+排名类图表：条形图。
+'''
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from config import config
+from charts.memo import memoize_figure
+from charts.facet import facet_groups, facet_kwargs, finish_facets
+
+# 横向排名条形图分面时子图之间的水平间距（占整个绘图区域的比例）
+RANK_FACET_SPACING = 0.2
+
+
+@memoize_figure
+def bar_rank(data, x, y, barmode='relative', is_vertical=False, facet=None,
+             facet_cols=config.facet_cols, width=config.width, height=0.618*config.width):
+    '''绘制排名条形图，data、x、y为rank_table()的结果；facet为分面列时绘制共用数值轴的子图'''
+    kwargs = {}
+    if facet is not None:
+        kwargs = facet_kwargs(facet, list(pd.unique(data[facet])), facet_cols)
+        if not is_vertical:
+            # 横向条形图的类别标签在各子图左侧，加大子图的水平间距
+            kwargs['facet_col_spacing'] = RANK_FACET_SPACING
+    # orientation = 'v' if is_vertical else 'h'
+    fig = px.bar(data, x=x, y=y, #text=y if is_vertical else x,
+                #  orientation=orientation,
+                width=width, height=height, **kwargs)
+
+    # 数值标签取自各trace自身的数值，分面时每个trace只包含一个分面的数据
+    value = 'y' if is_vertical else 'x'
+    fig.for_each_trace(lambda trace: trace.update(text=trace[value]))
+    fig.update_traces(
+        textposition='inside' if barmode=='relative' else 'outside',
+        textfont_family=config.font, textfont_size=config.size-2,
+    )
+    fig.update_layout(barmode=barmode)
+    # 分面时每个子图都有各自的坐标轴
+    fig.update_xaxes(showgrid=False, showline=False)
+    fig.update_yaxes(showgrid=False, showline=False)
+    if facet is not None:
+        finish_facets(fig)
+        # 各分面的排名类别不同，类别轴不共用
+        category_axes = fig.update_xaxes if is_vertical else fig.update_yaxes
+        category_axes(matches=None, showticklabels=True)
+
+    return fig
+
+
+def style_rank_axes(fig, is_vertical=False, reverse_axis=False, title=''):
+    '''设置排名条形图的坐标轴：类别轴可以反序，数值轴隐藏刻度标签并以title为标题。
+
+    分面时作用于每个子图，数值轴标题只显示在原本有标题的子图上。
+    '''
+    update = {'x': fig.update_xaxes, 'y': fig.update_yaxes}
+    category, value = ('x', 'y') if is_vertical else ('y', 'x')
+    update[category](autorange='reversed' if reverse_axis else True, title_text='')
+    update[value](showticklabels=False)
+    update[value](title_text=title, selector=lambda axis: bool(axis.title.text))
+    return fig
+
+
+def top_n(values, n):
+    '''返回values中最大的n个元素的下标，使用部分排序，不保证返回的顺序'''
+    if not n or n >= len(values):
+        return np.arange(len(values))
+    return np.argpartition(-values, n-1)[:n]
+
+
+def _rank(data, x, y, color, top, others, other):
+    if color is None:
+        table = data.groupby(x, sort=False, observed=True)[[y]].sum()
+    else:
+        # pivot_table对重复的(类别, 颜色)组合求和，避免pivot报错
+        table = data.pivot_table(index=x, columns=color, values=y,
+                                 aggfunc='sum', fill_value=0, sort=False,
+                                 observed=True)
+    totals = table.sum(axis=1).to_numpy()
+
+    keep = top_n(totals, top)
+    # 保留的类别按总数升序排列，横向条形图中数值最大的位于最上方
+    keep = keep[np.argsort(totals[keep], kind='stable')]
+    rest = np.ones(len(totals), dtype=bool)
+    rest[keep] = False
+
+    ranked = table.iloc[keep]
+    if others and rest.any():
+        rest_row = table.iloc[rest].sum().to_frame(other).T
+        ranked = pd.concat([rest_row, ranked])
+    ranked.index.name = x
+    ranked.columns.name = None
+    return ranked.reset_index()
+
+
+def rank_table(data, x, y, color=None, is_vertical=False,
+               top=None, others=False, other='其他', facet=None):
+    '''整理排名数据，返回排序后的数据以及bar_rank所需的x、y参数。
+
+    相同类别的数值先求和；top为保留的前N名（为None或0时保留全部），others为True时
+    其余类别合并为一个“其他”类别，显示在排名的最后。facet为分面列时数据按该列分组一次，
+    在每个分面中分别排名，结果的最后一列为facet列。
+    '''
+    if facet is None:
+        data = _rank(data, x, y, color, top, others, other)
+        values = data.columns[1:]
+    else:
+        parts = []
+        for key, part in facet_groups(data, facet, y):
+            part = _rank(part, x, y, color, top, others, other)
+            part[facet] = key
+            parts.append(part)
+        data = pd.concat(parts, ignore_index=True)
+        values = data.columns[1:-1]
+        # 某些颜色类别只出现在部分分面中
+        data[values] = data[values].fillna(0)
+
+    if color is None:
+        xval = x if is_vertical else y
+        yval = y if is_vertical else x
+    else:
+        yval = values if is_vertical else data.columns[0]
+        xval = data.columns[0] if is_vertical else values
+    return data, xval, yval
@@ -0,0 +1,45 @@
+'''
+趋势类图表：折线图、面积图和柱形图。
+
+facet为分面列时按该列的取值绘制共用坐标轴的子图，每行facet_cols个。
+'''
+import pandas as pd
+import plotly.express as px
+
+from config import config
+from charts.memo import memoize_figure
+from charts.facet import facet_groups, facet_kwargs, finish_facets
+
+
+def _trend(plot, data, x, y, color, facet, facet_cols, **kwargs):
+    if color is not None:
+        kwargs['color'] = color
+    if facet is None:
+        return plot(data, x=x, y=y, **kwargs)
+
+    # 数据按分面列分组一次，只保留显示的分面
+    groups = facet_groups(data, facet, y)
+    order = [key for key, _ in groups]
+    if groups:
+        data = pd.concat([part for _, part in groups], ignore_index=True)
+    return finish_facets(plot(data, x=x, y=y, **facet_kwargs(facet, order, facet_cols), **kwargs))
+
+
+@memoize_figure
+def line_trend(data, x='年份', y='申请量(项)', color=None, facet=None,
+               facet_cols=config.facet_cols, width=config.width, height=0.618*config.width):
+    return _trend(px.line, data, x, y, color, facet, facet_cols, width=width, height=height)
+
+
+@memoize_figure
+def area_trend(data, x='年份', y='申请量(项)', color=None, facet=None,
+               facet_cols=config.facet_cols, width=config.width, height=0.618*config.width):
+    return _trend(px.area, data, x, y, color, facet, facet_cols, width=width, height=height)
+
+
+@memoize_figure
+def bar_trend(data, x, y, color=None, barmode='relative', facet=None,
+              facet_cols=config.facet_cols, width=config.width, height=0.618*config.width):
+    # 只有一个数据系列时barmode不影响图表
+    return _trend(px.bar, data, x, y, color, facet, facet_cols, barmode=barmode,
+                  width=width, height=height)
@@ -0,0 +1,267 @@
+'''
+实用图表：单气泡图、饼状气泡图和桑基图。
+'''
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from config import config
+from charts.memo import memoize_figure
+
+# 饼状气泡图的屏幕分辨率，与matplotlib默认的figure.dpi相同，图表尺寸按此换算为英寸
+MPL_DPI = 100
+
+
+@memoize_figure
+def scatter_plot(data, x, y, size, showlabel=True, size_max=55,
+                 label_top_k=config.bubble_label_top_k, category_orders=None,
+                 width=config.width, height=0.618*config.width):
+# 长数据格式
+    # 气泡数量较多时改用WebGL渲染，避免浏览器绘制大量SVG元素
+    webgl = len(data) > config.webgl_cells
+    fig = px.scatter(
+        data, x=x, y=y, size=size,
+        size_max=size_max, category_orders=category_orders,
+        render_mode='webgl' if webgl else 'svg',
+        width=width, height=height,
+    )
+
+    # 只给数值最大的前label_top_k个气泡显示标签
+    text = data[size].to_numpy()
+    if showlabel and len(text) > label_top_k:
+        top = np.argpartition(-text, label_top_k)[:label_top_k]
+        mask = np.zeros(len(text), dtype=bool)
+        mask[top] = True
+        text = np.where(mask, text, None)
+    fig.update_traces(
+        text=text,
+        marker_line=dict(
+            color='#1A29FA',
+            width=2,
+        ),
+        mode='markers+text' if showlabel else 'markers',
+        marker_sizemode='area',
+    )
+    return fig
+
+
+def melt_bubble(data, x, y):
+    '''把“宽”格式的气泡图数据转换为scatter_plot所需的“长”格式，数值为0的单元格直接丢弃'''
+    values = data[y].to_numpy()
+    # 按列优先的顺序取非零单元格，与melt的行顺序一致
+    j, i = np.nonzero((values.T != 0) & ~pd.isna(values.T))
+    return pd.DataFrame({
+        x: data[x].to_numpy()[i],
+        'variable': np.asarray(y, dtype=object)[j],
+        'value': values[i, j],
+    })
+
+
+def bubble_orders(data, x, y):
+    '''返回气泡图的坐标轴类别顺序，丢弃0值后仍保留完整的行列标签'''
+    return {x: list(pd.unique(data[x])), 'variable': list(y)}
+
+
+@lru_cache(maxsize=None)
+def font_properties(path):
+    '''返回path字体文件的FontProperties，每个字体文件只创建一次，各图表只读共用'''
+    from matplotlib.font_manager import FontProperties
+    return FontProperties(fname=path)
+
+
+def scatter_pie(data, x, y, cat, colors=px.colors.qualitative.Plotly,
+                rscale=1.4, xscale=3.5, yscale=2, showlabel=True,
+                width=config.width, height=0.618*config.width):
+    '''绘制饼状气泡图，返回matplotlib的Figure。
+
+    不使用pyplot和全局的rcParams：图表直接创建为Figure并绑定Agg画布，字体和样式都设置在
+    各个元素上，多个会话可以在不同线程中同时绘制；图表不登记在pyplot中，不再引用时即被
+    回收，无需plt.close()。
+    '''
+    # 长宽混合数据格式
+    # matplotlib导入较慢，只在绘制饼状气泡图时才导入
+    import matplotlib.patches as mpatches
+    import matplotlib.collections as mcollections
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    font = font_properties(config.font)
+
+    dpi = MPL_DPI
+    pie_seg = np.unique(data[cat])
+    rows = np.unique(data[x])
+    cols = y
+    colors = dict(zip(pie_seg, colors))
+
+    grouped_data = data.drop(columns=cat).groupby(x).sum()
+    maximum = grouped_data.max().max()
+
+    # 一次性整理为(行, 饼图构成, 列)的三维数组，后续计算全部向量化
+    cells = data.groupby([x, cat])[cols].sum().reindex(
+        pd.MultiIndex.from_product([rows, pie_seg]), fill_value=0)
+    values = cells.to_numpy(dtype=float).reshape(len(rows), len(pie_seg), len(cols))
+    totals = values.sum(axis=1)
+    radius = np.sqrt(totals) / np.sqrt(maximum) * rscale
+
+    # 扇形从90度开始逆时针排列，与ax.pie(startangle=90)一致
+    fracs = np.divide(values, totals[:, None, :],
+                      out=np.zeros_like(values), where=totals[:, None, :] > 0)
+    theta2 = 90 + 360*np.cumsum(fracs, axis=1)
+    theta1 = theta2 - 360*fracs
+
+    i, k, j = np.nonzero(fracs)
+    wedges = [
+        mpatches.Wedge((cx, cy), r, t1, t2)
+        for cx, cy, r, t1, t2 in zip(
+            i*xscale, j*yscale, radius[i, j], theta1[i, k, j], theta2[i, k, j])
+    ]
+    seg_colors = np.array([colors[s] for s in pie_seg], dtype=object)
+
+    fig = Figure(figsize=(width/dpi, height/dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.add_collection(mcollections.PatchCollection(
+        wedges, facecolors=list(seg_colors[k]), edgecolors='face',
+        linewidths=0, clip_on=False,
+    ))
+    ax.set_aspect('equal')
+    ax.autoscale_view()
+
+    if showlabel:
+        i, j = np.nonzero(totals)
+        labels = [f'{v:g}' for v in totals[i, j]]
+        ax.add_collection(_text_collection(
+            fig, ax, labels, np.column_stack([i*xscale, j*yscale]), font), autolim=False)
+
+    ax.grid(True)
+    ax.yaxis.set_zorder(0)
+    ax.xaxis.set_zorder(0)
+    ax.set_xticks([i*xscale for i in range(len(rows))], labels=rows, fontproperties=font)
+    ax.set_yticks([j*yscale for j in range(len(cols))], labels=cols, fontproperties=font)
+
+    if len(pie_seg):
+        handles = [mpatches.Patch(color=colors[s]) for s in pie_seg]
+        ax.legend(handles, pie_seg, loc='upper left', prop=font,
+                  bbox_to_anchor=(1, 1), frameon=False)
+
+    return fig
+
+
+def _text_collection(fig, ax, labels, offsets, font):
+    '''把多个居中的文字标签合并为一个PathCollection，offsets为数据坐标'''
+    from matplotlib.textpath import TextPath
+    from matplotlib.collections import PathCollection
+    from matplotlib.transforms import Affine2D
+
+    size = font.get_size_in_points()
+    paths = {}
+    for label in set(labels):
+        path = TextPath((0, 0), label, size=size, prop=font)
+        ext = path.get_extents()
+        paths[label] = path.transformed(
+            Affine2D().translate(-(ext.x0+ext.x1)/2, -(ext.y0+ext.y1)/2))
+
+    return PathCollection(
+        [paths[label] for label in labels],
+        offsets=offsets, offset_transform=ax.transData,
+        # 文字路径以磅为单位，随保存时的dpi缩放
+        transform=Affine2D().scale(1/72) + fig.dpi_scale_trans,
+        facecolors='black', edgecolors='none',
+    )
+
+def hex2rgba(color, alpha=0.5):
+    r = int(color[1:3], 16)
+    g = int(color[3:5], 16)
+    b = int(color[5:7], 16)
+    return f'rgba({r},{g},{b},{alpha})'
+
+
+def sankey_flows(data, stages, value=None, threshold=0.0, other='其他'):
+    '''由多级节点列构建桑基图的节点和连接。
+
+    data为“长”数据格式，stages为按顺序排列的各级节点列，value为流量列（为None时按记录
+    计数）。每一级中流量低于总流量threshold比例的节点合并为一个“其他”节点。返回节点标签、
+    节点所在的级数、节点流量，以及连接的source、target、value数组。
+    '''
+    data = data.dropna(subset=stages)
+    weights = (np.ones(len(data)) if value is None
+               else data[value].to_numpy(dtype=float))
+    total = weights.sum()
+
+    labels, node_stage, node_values, codes = [], [], [], []
+    offset = 0
+    for k, stage in enumerate(stages):
+        code, uniques = pd.factorize(data[stage])
+        flow = np.bincount(code, weights=weights, minlength=len(uniques))
+        small = flow < threshold*total
+        if small.any():
+            # 小流量节点映射到末尾的“其他”节点，其余节点保持原有顺序
+            kept = np.flatnonzero(~small)
+            remap = np.full(len(uniques), len(kept))
+            remap[kept] = np.arange(len(kept))
+            code = remap[code]
+            uniques = list(uniques[kept]) + [other]
+            flow = np.append(flow[kept], flow[small].sum())
+        labels.extend(uniques)
+        node_stage.append(np.full(len(uniques), k))
+        node_values.append(flow)
+        codes.append(code + offset)
+        offset += len(uniques)
+
+    # 相邻两级之间的连接：对(source, target)组合去重后按组累加流量
+    source, target, link_value = [], [], []
+    for src, tgt in zip(codes[:-1], codes[1:]):
+        key = src.astype(np.int64)*offset + tgt
+        pairs, inverse = np.unique(key, return_inverse=True)
+        flow = np.bincount(inverse.ravel(), weights=weights, minlength=len(pairs))
+        nonzero = flow != 0
+        source.append(pairs[nonzero] // offset)
+        target.append(pairs[nonzero] % offset)
+        link_value.append(flow[nonzero])
+
+    return (list(labels), np.concatenate(node_stage), np.concatenate(node_values),
+            np.concatenate(source), np.concatenate(target), np.concatenate(link_value))
+
+
+@memoize_figure
+def sankey(data, colors=px.colors.qualitative.Plotly, showlinkcolor=False,
+           stages=None, value=None, threshold=0.0,
+           width=config.width, height=0.618*config.width):
+    if stages is None:
+        # “宽”数据格式：第1列为来源节点，其余各列为目标节点
+        outlabel = data.columns[0]
+        data = data.melt(id_vars=outlabel, var_name='__target__', value_name='__value__')
+        stages, value = [outlabel, '__target__'], '__value__'
+
+    label, node_stage, node_value, source, target, value = sankey_flows(
+        data, stages, value, threshold)
+
+    # 按第1级节点的流量取前9位着色，其他级中同名节点使用相同颜色
+    first = np.argsort(-node_value[node_stage == 0], kind='stable')
+    index_top9 = [label[i] for i in first[:9]]
+    colormap = dict(zip(index_top9, colors))
+    colors = [colormap.get(x, px.colors.qualitative.Plotly[-1]) for x in label]
+
+    # 连接颜色先按节点计算，再用source下标一次性取出
+    colormap1 = dict(zip(index_top9[:5], px.colors.qualitative.Plotly))
+    node_link_colors = np.array(
+        [hex2rgba(colormap1.get(x, '#AFAFAF')) for x in label], dtype=object)
+    link_colors = node_link_colors[source]
+
+    fig = go.Figure(data=[go.Sankey(
+        node=dict(
+            pad=15, thickness=20, line=dict(color='black', width=0.5),
+            label=label, color=colors,
+        ),
+        link=dict(
+            source=source, target=target, value=value, 
+            color=link_colors if showlinkcolor else '#AFAFAF',
+        )
+    )])
+    fig.update_layout(
+        width=width, height=height,
+    )
+    return fig
@@ -0,0 +1,76 @@
+'''
+上传数据的解析缓存。
+
+Streamlit每次交互都会重新执行整个页面脚本，这里按上传文件内容的哈希值和工作表名称
+缓存已解析的DataFrame，文件内容不变时直接复用，超过内存上限时按LRU顺序淘汰。
+缓存在同一进程内的所有会话和页面之间共享，取出的DataFrame应视为只读。
+'''
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import config
+
+
+def digest(content):
+    '''返回上传文件内容的哈希值，作为缓存键的一部分'''
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def frame_nbytes(data):
+    '''估算DataFrame占用的内存字节数'''
+    return int(data.memory_usage(index=True, deep=True).sum())
+
+
+class UploadCache:
+    '''按(内容哈希, 工作表)缓存解析结果的LRU缓存，容量以字节计'''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, data):
+        size = frame_nbytes(data)
+        with self._lock:
+            if key in self._items:
+                self._nbytes -= self._items.pop(key)[1]
+            # 单个结果超过上限时不缓存，避免把其他条目全部挤出
+            if size > self.max_bytes:
+                return data
+            self._items[key] = (data, size)
+            self._nbytes += size
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._nbytes -= evicted
+        return data
+
+    def get_or_parse(self, key, parse):
+        '''命中缓存时直接返回，否则调用parse()解析并写入缓存'''
+        data = self.get(key)
+        if data is None:
+            data = self.put(key, parse())
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._nbytes = 0
+
+
+upload_cache = UploadCache(config.upload_cache_mb * 2**20)
@@ -5,6 +5,9 @@ import numpy as np
 import pandas as pd
 
 import os
+import threading
+from collections.abc import Mapping
+
 cwd = os.getcwd()
 
 font = f'{cwd}/font/simhei.ttf'
@@ -49,25 +52,106 @@ red = '#EF553B'
 
 width = 800
 
-df = {
-    'single_trend': pd.DataFrame({
+# 上传数据解析缓存的内存上限(MB)，可通过环境变量调整
+upload_cache_mb = int(os.environ.get('PATENTVIS_UPLOAD_CACHE_MB', 512))
+
+# 上传文件超过该大小(MB)时，原始记录汇总改为分块流式读取，只保留各分组的部分计数，
+# 内存占用取决于分组数量而不是记录条数；chunk_rows为每块读取的行数
+stream_upload_mb = int(os.environ.get('PATENTVIS_STREAM_UPLOAD_MB', 100))
+chunk_rows = int(os.environ.get('PATENTVIS_CHUNK_ROWS', 200_000))
+
+# 导出图片的常驻渲染进程数量
+export_workers = int(os.environ.get('PATENTVIS_EXPORT_WORKERS', 2))
+
+# 导出结果缓存：内存上限(MB)，以及可选的磁盘缓存目录和磁盘上限(MB)，
+# 多个服务进程可以指向同一个磁盘缓存目录
+export_cache_mb = int(os.environ.get('PATENTVIS_EXPORT_CACHE_MB', 64))
+export_cache_dir = os.environ.get('PATENTVIS_EXPORT_CACHE_DIR') or None
+export_cache_disk_mb = int(os.environ.get('PATENTVIS_EXPORT_CACHE_DISK_MB', 1024))
+
+# 缓存的图表构建结果数量，只调整尺寸和页边空白时直接复用
+figure_cache_size = int(os.environ.get('PATENTVIS_FIGURE_CACHE_SIZE', 32))
+
+# 设置PATENTVIS_DIAGNOSTICS=1时在侧边栏显示本会话最近diagnostics_runs次页面执行的各阶段
+# 耗时；设置PATENTVIS_TIMING_LOG=1时把各阶段耗时以JSON格式逐行输出到标准错误
+diagnostics = os.environ.get('PATENTVIS_DIAGNOSTICS', '') not in ('', '0')
+diagnostics_runs = int(os.environ.get('PATENTVIS_DIAGNOSTICS_RUNS', 10))
+timing_log = os.environ.get('PATENTVIS_TIMING_LOG', '') not in ('', '0')
+
+# 气泡图的气泡数量超过该值时改用WebGL(Scattergl)渲染
+webgl_cells = int(os.environ.get('PATENTVIS_WEBGL_CELLS', 1000))
+# 发送到浏览器的图表中，长度不小于该值的数值数组编码为base64的typed array（bdata），
+# 设置为0时全部按JSON数组发送
+typed_array_min = int(os.environ.get('PATENTVIS_TYPED_ARRAY_MIN', 32))
+# 气泡图默认只给数值最大的前若干个气泡显示数值标签
+bubble_label_top_k = 200
+
+
+def _read_asset(name):
+    return lambda: pd.read_csv(f'./assets/{name}')
+
+
+_examples = {
+    'single_trend': lambda: pd.DataFrame({
         '年份': range(2011, 2011+5),
         '申请量(项)': np.random.randint(23, 57, size=5)}),
-    'multi_trend': pd.DataFrame({
+    'multi_trend': lambda: pd.DataFrame({
         '年份': range(2011, 2011+6),
         '地区': ['国内']*3 + ['国外']*3,
         '申请量(项)': np.random.randint(23, 57, size=6)
     }),
-    'pie': pd.DataFrame({
+    'pie': lambda: pd.DataFrame({
         '技术分支': ['X射线', '光学测量', '电子测量', '探针测量'],
         '申请量(项)': np.random.randint(100, 300, size=4)
     }),
-    'treemap': pd.read_csv('./assets/tech_treemap.csv'),
-    'waterfall': pd.read_csv('./assets/tech_comp.csv'),
-    'dualbar': pd.read_csv('./assets/tech_dualbar.csv'),
-    'rank_single': pd.read_csv('./assets/rank_single.csv'),
-    'rank_multi': pd.read_csv('./assets/rank_multi.csv'),
-    'bubble': pd.read_csv('./assets/bubble.csv'),
-    'bubble_pie': pd.read_csv('./assets/bubble_pie.csv'),
-    'sankey': pd.read_csv('./assets/sankey.csv')
-}
\ No newline at end of file
+    'treemap': _read_asset('tech_treemap.csv'),
+    'waterfall': _read_asset('tech_comp.csv'),
+    'dualbar': _read_asset('tech_dualbar.csv'),
+    'rank_single': _read_asset('rank_single.csv'),
+    'rank_multi': _read_asset('rank_multi.csv'),
+    'bubble': _read_asset('bubble.csv'),
+    'bubble_pie': _read_asset('bubble_pie.csv'),
+    'sankey': _read_asset('sankey.csv'),
+}
+
+
+class SampleData(Mapping):
+    '''数据格式示例，首次访问某个示例时才读取或生成，之后在进程内缓存'''
+
+    def __init__(self, loaders):
+        self._loaders = loaders
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._cache:
+                self._cache[name] = self._loaders[name]()
+            return self._cache[name]
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+    def __len__(self):
+        return len(self._loaders)
+
+
+df = SampleData(_examples)
+
+# 导出SVG图片时如何处理文字的字体：embed在图片中嵌入只包含所用字符的字体子集，path把文字
+# 转换为路径，none不处理（显示效果取决于查看图片的电脑上安装的字体）；字体子集按字符集缓存。
+# 没有字体文件时默认不处理
+svg_fonts = os.environ.get('PATENTVIS_SVG_FONTS', 'embed' if os.path.exists(font) else 'none')
+font_family = 'SimHei'
+font_subset_cache = int(os.environ.get('PATENTVIS_FONT_SUBSET_CACHE', 32))
+
+# 申请人名称归一化：名称与规范名称对应表的保存位置（可以直接编辑，各次上传共用），以及
+# 判断两个名称为同一申请人的相似度阈值
+name_map = (os.environ.get('PATENTVIS_NAME_MAP')
+            or os.path.join(os.path.expanduser('~'), '.patentvis', 'applicants.csv'))
+name_similarity = float(os.environ.get('PATENTVIS_NAME_SIMILARITY', 0.8))
+
+# 分面图表：默认每行的子图数量、最多显示的分面数量，以及每行子图的最低高度(像素)
+facet_cols = int(os.environ.get('PATENTVIS_FACET_COLS', 3))
+facet_max = int(os.environ.get('PATENTVIS_FACET_MAX', 24))
+facet_row_height = int(os.environ.get('PATENTVIS_FACET_ROW_HEIGHT', 240))
@@ -0,0 +1,288 @@
+'''
+图片导出模块。
+
+Plotly图表交给常驻的渲染进程池导出为内存中的字节串，每个工作进程只在启动时付出一次
+Kaleido的初始化开销，多个会话同时导出时可以并行渲染，也不再读写工作目录下共享的
+临时文件。进程池大小由config.export_workers配置。
+
+导出结果按图表JSON、图片格式和缩放比例的哈希值缓存，先查进程内的内存缓存，再查可选的
+磁盘缓存目录(config.export_cache_dir)。磁盘缓存通过原子替换写入，可以由多个服务进程
+共享，总大小超过上限时按最近使用时间淘汰。
+
+SVG图片在渲染进程中按fonts参数（默认为config.svg_fonts）嵌入字体子集或把文字转换为
+路径，见config.fonts。
+
+export_bundle()把多个图表一次导出为SVG和PNG图片，由渲染进程池并行渲染，结果直接写入
+内存中的ZIP文件。
+'''
+import io
+import os
+import json
+import hashlib
+import tempfile
+import zipfile
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from config import config
+
+# 批量导出时各图片格式的缩放比例，与页面中的下载按钮一致
+BUNDLE_SCALES = {'svg': 1, 'png': 3}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _warmup():
+    # 工作进程启动时先渲染一个空白图表，提前启动Kaleido
+    import plotly.io as pio
+    pio.to_image({'data': [], 'layout': {}}, format='png', validate=False)
+
+
+def static_figure(fig):
+    '''把图表字典中的WebGL散点图转换为普通散点图后返回。
+
+    Kaleido无法在无头环境中渲染WebGL图层，而且静态图片本来也不需要WebGL；转换后导出的
+    SVG图片仍是矢量图形。
+    '''
+    for trace in fig.get('data', []):
+        if trace.get('type') == 'scattergl':
+            trace['type'] = 'scatter'
+    return fig
+
+
+def _render(fig_json, ext, scale, fonts=None):
+    import plotly.io as pio
+    image = pio.to_image(static_figure(json.loads(fig_json)), format=ext, scale=scale,
+                         validate=False)
+    if ext == 'svg':
+        from config.fonts import finish_svg
+        image = finish_svg(image, fonts)
+    return image
+
+
+def renderer_pool():
+    '''返回进程内共享的渲染进程池，首次调用时创建'''
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # streamlit服务进程是多线程的，使用spawn避免fork带来的死锁
+            _pool = ProcessPoolExecutor(
+                max_workers=config.export_workers,
+                mp_context=mp.get_context('spawn'),
+                initializer=_warmup,
+            )
+        return _pool
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def submit_image(fig, ext, scale=1, fonts=None):
+    '''把Plotly图表提交给渲染进程池，返回Future'''
+    if not isinstance(fig, str):
+        fig = fig.to_json()
+    return renderer_pool().submit(_render, fig, ext, scale, fonts or config.svg_fonts)
+
+
+def render_image(fig, ext, scale=1, fonts=None):
+    '''不经过缓存，直接把Plotly图表渲染为ext格式的图片字节串'''
+    pool = renderer_pool()
+    try:
+        return submit_image(fig, ext, scale, fonts).result()
+    except BrokenProcessPool:
+        # 工作进程异常退出时重建进程池并重试一次
+        _reset_pool(pool)
+        return submit_image(fig, ext, scale, fonts).result()
+
+
+def export_key(fig_json, ext, scale, fonts=None):
+    '''由图表JSON、图片格式、缩放比例和SVG字体处理方式计算导出结果的缓存键'''
+    h = hashlib.sha256(fig_json.encode('utf-8'))
+    h.update(f'|{ext}|{scale}'.encode('ascii'))
+    if ext == 'svg':
+        h.update(f'|{fonts or config.svg_fonts}'.encode('ascii'))
+    return h.hexdigest()
+
+
+class ExportCache:
+    '''导出结果的内容寻址缓存，内存LRU加可选的磁盘存储'''
+
+    def __init__(self, max_bytes, directory=None, disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._items = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'rb') as file:
+                image = file.read()
+            # 更新修改时间，磁盘淘汰时按最近使用排序
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            return None
+        self._remember(key, image)
+        return image
+
+    def put(self, key, image):
+        self._remember(key, image)
+        if self.directory:
+            self._store(key, image)
+        return image
+
+    def _remember(self, key, image):
+        with self._lock:
+            if key in self._items or len(image) > self.max_bytes:
+                return
+            self._items[key] = image
+            self._nbytes += len(image)
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._nbytes -= len(evicted)
+
+    def _store(self, key, image):
+        # 先写临时文件再原子替换，其他进程不会读到写了一半的文件
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(image)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # 其他进程已经删除了该文件
+                pass
+            total -= size
+
+
+export_cache = ExportCache(
+    config.export_cache_mb * 2**20,
+    directory=config.export_cache_dir,
+    disk_max_bytes=config.export_cache_disk_mb * 2**20,
+)
+
+
+def export_image(fig, ext, scale=1, fonts=None):
+    '''把Plotly图表渲染为ext格式的图片字节串，相同的图表只渲染一次。
+
+    fonts为SVG图片的字体处理方式（embed、path或none），默认为config.svg_fonts。
+    '''
+    fig_json = fig if isinstance(fig, str) else fig.to_json()
+    key = export_key(fig_json, ext, scale, fonts)
+    image = export_cache.get(key)
+    if image is None:
+        image = export_cache.put(key, render_image(fig_json, ext, scale, fonts))
+    return image
+
+
+def savefig_bytes(fig, ext, dpi=300):
+    '''把matplotlib图表保存为ext格式的图片字节串'''
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=ext, bbox_inches='tight', dpi=dpi)
+    return buffer.getvalue()
+
+
+def _bundle_names(names):
+    '''为每个图表生成ZIP文件中不重复的文件名(不含扩展名)'''
+    used = set()
+    for name in names:
+        unique, i = name, 1
+        while unique in used:
+            i += 1
+            unique = f'{name}_{i}'
+        used.add(unique)
+        yield unique
+
+
+def _write(bundle, filename, image):
+    # PNG图片本身已经压缩，只压缩SVG等文本格式
+    compress = zipfile.ZIP_STORED if filename.endswith('.png') else zipfile.ZIP_DEFLATED
+    bundle.writestr(filename, image, compress_type=compress)
+
+
+def export_bundle(items, formats=('svg', 'png'), fonts=None):
+    '''把items中的(名称, 图表)逐一导出为formats中的各格式，返回ZIP文件的字节串。
+
+    Plotly图表（Figure或JSON字符串）全部提交给渲染进程池并行渲染，已经导出过的图片直接
+    取自导出缓存；渲染期间在当前线程中保存matplotlib图表。图片渲染完成后立即写入内存中
+    的ZIP文件，不在工作目录中产生临时文件。fonts为SVG图片的字体处理方式。
+    '''
+    buffer = io.BytesIO()
+    pending = {}
+    figures = []
+    with zipfile.ZipFile(buffer, 'w') as bundle:
+        names = _bundle_names([name for name, _ in items])
+        for name, (_, fig) in zip(names, items):
+            if hasattr(fig, 'savefig'):
+                figures.append((name, fig))
+                continue
+            fig_json = fig if isinstance(fig, str) else fig.to_json()
+            for ext in formats:
+                scale = BUNDLE_SCALES.get(ext, 1)
+                key = export_key(fig_json, ext, scale, fonts)
+                image = export_cache.get(key)
+                if image is not None:
+                    _write(bundle, f'{name}.{ext}', image)
+                    continue
+                task = (f'{name}.{ext}', key, fig_json, ext, scale, fonts)
+                try:
+                    pending[submit_image(fig_json, ext, scale, fonts)] = task
+                except BrokenProcessPool:
+                    _write(bundle, task[0], export_cache.put(key, render_image(*task[2:])))
+
+        for name, fig in figures:
+            for ext in formats:
+                _write(bundle, f'{name}.{ext}', savefig_bytes(fig, ext, dpi=300))
+
+        for future in as_completed(pending):
+            filename, key, fig_json, ext, scale, fonts = pending[future]
+            try:
+                image = future.result()
+            except BrokenProcessPool:
+                # 工作进程异常退出时render_image会重建进程池
+                image = render_image(fig_json, ext, scale, fonts)
+            _write(bundle, filename, export_cache.put(key, image))
+    return buffer.getvalue()
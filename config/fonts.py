@@ -0,0 +1,274 @@
+'''
+导出SVG图片时的字体处理。
+
+图表模板中的字体设置为config.font字体文件的路径，浏览器和Kaleido并不会按路径加载字体，
+导出的SVG图片中的文字实际使用查看图片的电脑上的字体。finish_svg()按config.svg_fonts
+处理Kaleido导出的SVG图片，使图片不依赖本机安装的字体：
+
+* embed：只保留图片中用到的字符，生成字体子集，以@font-face嵌入图片；
+* path：把文字转换为字形路径，同一字形只定义一次，之后通过<use>引用。字体中没有的字符
+  所在的文字保持原样，并嵌入其余字符的字体子集。
+
+字体子集按字符集缓存，同一图表的不同尺寸、配色等重复导出时无需再次生成子集。安装brotli
+时字体子集使用体积更小的WOFF2格式，否则使用TTF格式。字体文件不存在或无法读取时记录一次
+警告，SVG图片保持原样。
+'''
+import io
+import base64
+import logging
+import unicodedata
+from functools import lru_cache
+from xml.etree import ElementTree as ET
+
+from config import config
+
+try:
+    import brotli  # noqa: F401  fontTools生成WOFF2格式时需要
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+ET.register_namespace('', SVG_NS)
+ET.register_namespace('xlink', XLINK_NS)
+
+TEXT = f'{{{SVG_NS}}}text'
+TSPAN = f'{{{SVG_NS}}}tspan'
+DEFS = f'{{{SVG_NS}}}defs'
+HREF = f'{{{XLINK_NS}}}href'
+
+# 转换为路径时从文字样式中去掉的字体属性
+FONT_PROPERTIES = ('font-family', 'font-size', 'font-weight', 'font-style', 'white-space')
+
+logger = logging.getLogger('patentvis.fonts')
+
+
+@lru_cache(maxsize=1)
+def _font_bytes():
+    with open(config.font, 'rb') as file:
+        return file.read()
+
+
+@lru_cache(maxsize=1)
+def font_available():
+    '''config.font字体文件能否读取，不能读取时记录一次警告'''
+    try:
+        _font_bytes()
+    except OSError as error:
+        logger.warning('无法读取字体文件%s（%s），导出的SVG图片不处理字体', config.font, error)
+        return False
+    return True
+
+
+@lru_cache(maxsize=1)
+def _font():
+    '''只读的完整字体，用于查询字符映射、字宽和字形轮廓'''
+    from fontTools.ttLib import TTFont
+    return TTFont(io.BytesIO(_font_bytes()), lazy=True)
+
+
+@lru_cache(maxsize=config.font_subset_cache)
+def subset_font(chars):
+    '''生成只包含chars中各字符的字体子集，返回(字体数据, MIME类型)。
+
+    chars应为排序后的字符串，相同字符集的结果直接取自缓存。
+    '''
+    from fontTools.ttLib import TTFont
+    from fontTools.subset import Options, Subsetter
+
+    options = Options()
+    options.hinting = False
+    options.desubroutinize = True
+    options.layout_features = ['*']
+    options.drop_tables += ['FFTM']
+    options.flavor = 'woff2' if HAS_BROTLI else None
+    # Subsetter会修改字体，每次从原始数据重新读取
+    font = TTFont(io.BytesIO(_font_bytes()))
+    subsetter = Subsetter(options)
+    subsetter.populate(text=chars)
+    subsetter.subset(font)
+    buffer = io.BytesIO()
+    font.save(buffer)
+    return buffer.getvalue(), 'font/woff2' if HAS_BROTLI else 'font/ttf'
+
+
+def _style(value):
+    '''把style属性解析为有序字典'''
+    items = (item.split(':', 1) for item in (value or '').split(';') if ':' in item)
+    return {k.strip(): v.strip() for k, v in items}
+
+
+def _format_style(style):
+    return '; '.join(f'{k}: {v}' for k, v in style.items()) + (';' if style else '')
+
+
+def _font_face(chars):
+    data, mime = subset_font(''.join(sorted(chars)))
+    fmt = 'woff2' if mime == 'font/woff2' else 'truetype'
+    family = config.font_family
+    return (f"@font-face {{ font-family: '{family}'; "
+            f"src: url(data:{mime};base64,{base64.b64encode(data).decode('ascii')}) "
+            f"format('{fmt}'); }} text {{ font-family: '{family}', sans-serif; }}")
+
+
+def _defs(root):
+    defs = root.find(DEFS)
+    if defs is None:
+        defs = ET.Element(DEFS)
+        root.insert(0, defs)
+    return defs
+
+
+def _embed(root, texts):
+    '''在SVG中嵌入texts中各文字所用字符的字体子集，并让这些文字优先使用该字体'''
+    chars = {c for text in texts for c in ''.join(text.itertext())
+             if not c.isspace() and unicodedata.category(c) != 'Cf'}
+    if not chars:
+        return
+    family = f"'{config.font_family}'"
+    for text in texts:
+        for element in text.iter():
+            style = _style(element.get('style'))
+            if 'font-family' in style and not style['font-family'].startswith(family):
+                style['font-family'] = f"{family}, {style['font-family']}"
+                element.set('style', _format_style(style))
+    style = ET.Element(f'{{{SVG_NS}}}style')
+    style.text = _font_face(chars)
+    _defs(root).insert(0, style)
+
+
+def _length(value, size):
+    '''把dy等长度属性转换为像素，em按当前字号换算'''
+    value = value.strip()
+    if value.endswith('em'):
+        return float(value[:-2]) * size
+    return float(value.removesuffix('px'))
+
+
+def _font_size(style, size):
+    value = _style(style).get('font-size')
+    if value is None:
+        return size
+    if value.endswith('%'):
+        return size * float(value[:-1]) / 100
+    return float(value.removesuffix('px'))
+
+
+class _Unsupported(Exception):
+    '''文字中包含无法转换为路径的内容'''
+
+
+def _layout(text, size):
+    '''计算<text>中每个字符的位置，返回[(text-anchor起点x, 宽度, [(字形名, 字号, 偏移, y)])]'''
+    font = _font()
+    cmap = font.getBestCmap()
+    hmtx = font['hmtx']
+    scale = 1 / font['head'].unitsPerEm
+    chunks = []
+    y = 0.0
+
+    def add(string, size):
+        for char in string:
+            glyph = cmap.get(ord(char))
+            if glyph is None:
+                if unicodedata.category(char) == 'Cf':
+                    continue
+                raise _Unsupported(char)
+            chunk = chunks[-1]
+            chunk[2].append((glyph, size, chunk[1], y))
+            chunk[1] += hmtx[glyph][0] * scale * size
+
+    def visit(element, size):
+        nonlocal y
+        if element.tag not in (TEXT, TSPAN):
+            raise _Unsupported(element.tag)
+        size = _font_size(element.get('style'), size)
+        if element.get('x') is not None or not chunks:
+            chunks.append([float(element.get('x', 0)), 0.0, []])
+        if element.get('y') is not None:
+            y = float(element.get('y'))
+        if element.get('dy') is not None:
+            y += _length(element.get('dy'), size)
+        add(element.text or '', size)
+        for child in element:
+            visit(child, size)
+            add(child.tail or '', size)
+
+    visit(text, size)
+    return chunks
+
+
+@lru_cache(maxsize=4096)
+def _glyph_path(glyph):
+    from fontTools.pens.svgPathPen import SVGPathPen
+    glyph_set = _font().getGlyphSet()
+    pen = SVGPathPen(glyph_set)
+    glyph_set[glyph].draw(pen)
+    return pen.getCommands()
+
+
+def _outline(text, size, glyphs):
+    '''把<text>转换为引用字形路径的<g>，无法转换时返回None'''
+    try:
+        chunks = _layout(text, size)
+    except _Unsupported:
+        return None
+    style = _style(text.get('style'))
+    anchor = text.get('text-anchor') or style.get('text-anchor', 'start')
+    shift = {'middle': 0.5, 'end': 1.0}.get(anchor, 0.0)
+    scale = 1 / _font()['head'].unitsPerEm
+
+    group = ET.Element(f'{{{SVG_NS}}}g')
+    for name in ('class', 'transform'):
+        if text.get(name) is not None:
+            group.set(name, text.get(name))
+    group.set('style', _format_style(
+        {k: v for k, v in style.items() if k not in FONT_PROPERTIES and k != 'text-anchor'}))
+    for x, width, placed in chunks:
+        x -= width * shift
+        for glyph, glyph_size, offset, y in placed:
+            path = _glyph_path(glyph)
+            if not path:
+                continue
+            glyph_id = f'pv-glyph-{_font().getGlyphID(glyph)}'
+            if glyph_id not in glyphs:
+                glyphs[glyph_id] = path
+            s = glyph_size * scale
+            use = ET.SubElement(group, f'{{{SVG_NS}}}use')
+            use.set(HREF, f'#{glyph_id}')
+            use.set('transform', f'matrix({s:.6g} 0 0 {-s:.6g} {x + offset:.2f} {y:.2f})')
+    return group
+
+
+def _to_paths(root):
+    '''把文字转换为路径，返回无法转换而保持原样的<text>元素'''
+    glyphs = {}
+    remaining = []
+    texts = [(parent, i, child) for parent in root.iter()
+             for i, child in enumerate(parent) if child.tag == TEXT]
+    for parent, i, text in texts:
+        group = _outline(text, _font_size(text.get('style'), 12.0), glyphs)
+        if group is None:
+            remaining.append(text)
+        else:
+            parent[i] = group
+    if glyphs:
+        defs = _defs(root)
+        for glyph_id, path in glyphs.items():
+            ET.SubElement(defs, f'{{{SVG_NS}}}path', {'id': glyph_id, 'd': path})
+    return remaining
+
+
+def finish_svg(image, fonts=None):
+    '''按fonts（默认为config.svg_fonts）处理Kaleido导出的SVG图片字节串'''
+    fonts = fonts or config.svg_fonts
+    if fonts not in ('embed', 'path') or not font_available():
+        return image
+    root = ET.fromstring(image)
+    if fonts == 'path':
+        texts = _to_paths(root)
+    else:
+        texts = [text for text in root.iter(TEXT)]
+    _embed(root, texts)
+    return ET.tostring(root, encoding='unicode').encode('utf-8')
@@ -0,0 +1,268 @@
+'''
+统一的数据读取模块。
+
+根据文件头部的魔数判断文件格式，避免对Excel文件先做一次失败的CSV解析；CSV文件
+先用少量样本探测文本编码（兼容国内专利数据库导出的GBK/GB18030文件），并在安装了
+pyarrow时使用更快的pyarrow解析引擎。Excel文件的工作表名称和尺寸直接从工作簿元数据中
+读取，只解析选中的工作表，安装了python-calamine时使用更快的calamine引擎。Parquet和
+Arrow/Feather等列式格式只读取文件元数据中的表结构，绘图时只读取所需的列。大文件还可以
+用iter_chunks()分块读取。本模块不依赖streamlit，也可用于命令行脚本。
+'''
+import codecs
+import importlib.util
+import io
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+XLSX_MAGIC = b'PK\x03\x04'
+XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+PARQUET_MAGIC = b'PAR1'
+ARROW_MAGIC = b'ARROW1'
+FEATHER_V1_MAGIC = b'FEA1'
+
+# 列式格式，可以只读取部分列
+COLUMNAR = ('parquet', 'arrow')
+
+# 依次尝试的编码，GB18030是GBK/GB2312的超集
+ENCODINGS = ['utf-8', 'gb18030', 'big5']
+SAMPLE_SIZE = 64 * 1024
+CHUNK_ROWS = 200_000
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+HAS_CALAMINE = importlib.util.find_spec('python_calamine') is not None
+
+_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_DIMENSION = re.compile(rb'<(?:\w+:)?dimension\s+ref="([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?"')
+
+
+def sniff_format(content):
+    '''根据文件头部的魔数返回文件格式：'xlsx'、'xls'、'parquet'、'arrow'或'csv'
+
+    Feather文件即Arrow IPC文件格式，与早期的Feather V1格式一样归为'arrow'。
+    '''
+    if content.startswith(XLSX_MAGIC):
+        return 'xlsx'
+    if content.startswith(XLS_MAGIC):
+        return 'xls'
+    if content.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    if content.startswith((ARROW_MAGIC, FEATHER_V1_MAGIC)):
+        return 'arrow'
+    return 'csv'
+
+
+def sniff_encoding(content, sample_size=SAMPLE_SIZE):
+    '''用文件开头的一小段样本探测CSV文件的文本编码'''
+    if content.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    sample = content[:sample_size]
+    if len(content) > sample_size:
+        # 截断到最后一个换行符，避免把多字节字符从中间截断
+        sample = sample[:sample.rfind(b'\n') + 1] or sample
+    for encoding in ENCODINGS:
+        try:
+            sample.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return 'latin-1'
+
+
+def csv_engine():
+    '''返回可用的最快CSV解析引擎'''
+    return 'pyarrow' if HAS_PYARROW else 'c'
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def _xlsx_dimension(book, path):
+    '''从工作表XML开头的<dimension>元素读取行数和列数，不解析单元格数据'''
+    try:
+        with book.open(path) as stream:
+            head = stream.read(4096)
+    except KeyError:
+        return None, None
+    match = _DIMENSION.search(head)
+    if match is None:
+        return None, None
+    col1, row1, col2, row2 = (g.decode('ascii') if g else None for g in match.groups())
+    if col2 is None:
+        col2, row2 = col1, row1
+    return int(row2) - int(row1) + 1, _column_number(col2) - _column_number(col1) + 1
+
+
+def _xlsx_sheets(content):
+    with zipfile.ZipFile(io.BytesIO(content)) as book:
+        workbook = ET.fromstring(book.read('xl/workbook.xml'))
+        rels = ET.fromstring(book.read('xl/_rels/workbook.xml.rels'))
+        targets = {rel.get('Id'): rel.get('Target', '') for rel in rels}
+        sheets = []
+        for node in workbook.iter(f'{{{_MAIN_NS}}}sheet'):
+            target = targets.get(node.get(f'{{{_REL_NS}}}id'), '')
+            path = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+            sheets.append((node.get('name'), *_xlsx_dimension(book, path)))
+    return sheets
+
+
+def excel_sheets(content):
+    '''从工作簿元数据读取各工作表的名称和尺寸，返回[(名称, 行数, 列数)]。
+
+    xlsx文件只读取workbook.xml和各工作表开头的尺寸信息，xls文件按需打开工作簿，
+    尺寸未知时为None；其他格式返回空列表。
+    '''
+    fmt = sniff_format(content)
+    if fmt == 'xls':
+        import xlrd
+        book = xlrd.open_workbook(file_contents=content, on_demand=True)
+        return [(name, None, None) for name in book.sheet_names()]
+    if fmt != 'xlsx':
+        return []
+    try:
+        return _xlsx_sheets(content)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        # 元数据不规范时由pandas打开工作簿读取名称
+        return [(name, None, None) for name in pd.ExcelFile(io.BytesIO(content)).sheet_names]
+
+
+def sheet_names(content):
+    '''返回Excel文件的工作表名称列表，其他格式返回空列表'''
+    return [name for name, _, _ in excel_sheets(content)]
+
+
+def _read_excel(content, sheet=None, nrows=None):
+    '''只解析选中的工作表：xlsx文件用openpyxl的只读模式逐行读取，xls文件按需加载工作表'''
+    if HAS_CALAMINE:
+        return pd.read_excel(io.BytesIO(content), sheet_name=sheet or 0, nrows=nrows,
+                             engine='calamine')
+    if sniff_format(content) == 'xls':
+        import xlrd
+        book = xlrd.open_workbook(file_contents=content, on_demand=True)
+        return pd.read_excel(book, sheet_name=sheet or 0, nrows=nrows, engine='xlrd')
+    return pd.read_excel(io.BytesIO(content), sheet_name=sheet or 0, nrows=nrows,
+                         engine='openpyxl')
+
+
+def _require_pyarrow(fmt):
+    if not HAS_PYARROW:
+        raise ImportError(f'读取{fmt}格式的文件需要安装pyarrow')
+
+
+def _arrow_table(content, columns=None):
+    '''读取Arrow IPC/Feather文件；未压缩的列直接引用内存中的数据，不复制'''
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    return feather.read_table(pa.BufferReader(content), columns=columns)
+
+
+def _arrow_file(content):
+    '''打开Arrow IPC文件，只解析文件尾部的表结构和各批数据的位置'''
+    import pyarrow as pa
+    return pa.ipc.open_file(pa.BufferReader(content))
+
+
+def read_columns(content, sheet=None):
+    '''返回数据的列名。列式格式只读取文件元数据中的表结构，其他格式读取表头'''
+    fmt = sniff_format(content)
+    if fmt == 'parquet':
+        _require_pyarrow(fmt)
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(io.BytesIO(content))
+        index = schema.pandas_metadata.get('index_columns', []) if schema.pandas_metadata else []
+        return [name for name in schema.names if name not in index]
+    if fmt == 'arrow':
+        _require_pyarrow(fmt)
+        if content.startswith(FEATHER_V1_MAGIC):
+            return _arrow_table(content).schema.names
+        return _arrow_file(content).schema.names
+    return list(read_preview(content, sheet, nrows=0).columns)
+
+
+def read_preview(content, sheet=None, nrows=3):
+    '''只读取前nrows行数据，用于快速预览'''
+    fmt = sniff_format(content)
+    if fmt == 'csv':
+        # pyarrow引擎不支持nrows参数，预览时使用C引擎
+        return pd.read_csv(io.BytesIO(content), nrows=nrows,
+                           encoding=sniff_encoding(content))
+    if fmt == 'parquet':
+        _require_pyarrow(fmt)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        file = pq.ParquetFile(io.BytesIO(content))
+        # 只解码第一个行组中的一批数据
+        batch = next(file.iter_batches(batch_size=max(nrows, 1)), None)
+        if batch is None:
+            return file.schema_arrow.empty_table().to_pandas()
+        return pa.Table.from_batches([batch]).slice(0, nrows).to_pandas()
+    if fmt == 'arrow':
+        _require_pyarrow(fmt)
+        if content.startswith(FEATHER_V1_MAGIC):
+            return _arrow_table(content).slice(0, nrows).to_pandas()
+        file = _arrow_file(content)
+        if file.num_record_batches == 0:
+            return file.schema.empty_table().to_pandas()
+        return file.get_batch(0).slice(0, nrows).to_pandas()
+    return _read_excel(content, sheet, nrows)
+
+
+def read_data(content, sheet=None, columns=None):
+    '''读取完整数据，Excel文件读取指定的工作表。
+
+    columns不为None时只返回这些列；列式格式只读取和解码这些列，其他格式读取全部数据
+    后再选取。
+    '''
+    fmt = sniff_format(content)
+    if fmt == 'parquet':
+        _require_pyarrow(fmt)
+        return pd.read_parquet(io.BytesIO(content), engine='pyarrow', columns=columns)
+    if fmt == 'arrow':
+        _require_pyarrow(fmt)
+        return _arrow_table(content, columns).to_pandas()
+    if fmt == 'csv':
+        data = pd.read_csv(io.BytesIO(content), engine=csv_engine(),
+                           encoding=sniff_encoding(content))
+    else:
+        data = _read_excel(content, sheet)
+    return data if columns is None else data[list(columns)]
+
+
+def iter_chunks(content, columns=None, chunksize=CHUNK_ROWS, sheet=None):
+    '''分块读取数据，依次返回不超过chunksize行、只包含columns中各列的DataFrame。
+
+    CSV文件用C引擎分块解析，Parquet文件逐批解码所选的列，Arrow文件直接引用内存中的
+    各批数据；Excel文件不支持分块读取，整体读取后作为一块返回。
+    '''
+    fmt = sniff_format(content)
+    if fmt == 'csv':
+        with pd.read_csv(io.BytesIO(content), usecols=columns, chunksize=chunksize,
+                         encoding=sniff_encoding(content)) as reader:
+            yield from reader
+    elif fmt == 'parquet':
+        _require_pyarrow(fmt)
+        import pyarrow.parquet as pq
+        file = pq.ParquetFile(io.BytesIO(content))
+        for batch in file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif fmt == 'arrow':
+        _require_pyarrow(fmt)
+        if content.startswith(FEATHER_V1_MAGIC):
+            batches = _arrow_table(content, columns).to_batches()
+        else:
+            file = _arrow_file(content)
+            batches = (file.get_batch(i) for i in range(file.num_record_batches))
+            if columns is not None:
+                batches = (batch.select(columns) for batch in batches)
+        for batch in batches:
+            for start in range(0, batch.num_rows, chunksize):
+                yield batch.slice(start, chunksize).to_pandas()
+    else:
+        yield read_data(content, sheet, columns)
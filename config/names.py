@@ -0,0 +1,276 @@
+'''
+申请人名称归一化。
+
+同一申请人在专利数据中常有多种写法：全角半角、大小写、标点和多余的分隔符、“有限公司”
+“Co., Ltd.”等公司后缀，以及个别字符的差异。这里先把名称规整为名称键，名称键相同的直接
+合并；其余名称按字符n-gram计算MinHash签名，用LSH分桶只比较同一桶中的候选名称，签名相似度
+达到阈值的名称合并为一组，整体耗时与名称数量近似成线性关系。
+
+每组中数值（例如申请量）最大的写法作为规范名称。名称与规范名称的对应表保存在
+config.name_map文件中，之后的上传直接复用，只有新出现的名称才需要匹配；该文件可以直接
+编辑，例如把英文名称对应到中文规范名称。
+'''
+import os
+import tempfile
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from config import config
+
+# 比较名称键时去掉的标点和空白
+PUNCTUATION = r'[\s.,;:!?\'"()\[\]{}<>&/\\_\-、，；：。！？“”‘’（）【】《》·]+'
+# 名称末尾的公司类型后缀
+CN_SUFFIXES = r'(?:股份有限公司|有限责任公司|有限公司|集团公司|公司)$'
+EN_SUFFIXES = (r'(?:\s*\b(?:co|company|corporation|corp|incorporated|inc|ltd|limited|llc|'
+               r'gmbh|ag|sa|plc|kk|bv|nv)\b)+$')
+# 去掉名称两端的这些字符作为显示名称
+STRIP_CHARS = ' \t;；,，、'
+
+SIGNATURE_SIZE = 64
+BANDS = 16
+_PRIME = 2**31 - 1
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, _PRIME, SIGNATURE_SIZE, dtype=np.int64)
+_B = _rng.integers(0, _PRIME, SIGNATURE_SIZE, dtype=np.int64)
+_BAND_WEIGHTS = _rng.integers(1, 2**63, SIGNATURE_SIZE // BANDS, dtype=np.uint64)
+
+
+def name_keys(names):
+    '''把名称规整为用于比较的名称键：统一全半角和大小写，去掉标点、空白和公司类型后缀'''
+    text = pd.Series(names, dtype='string').str.normalize('NFKC').str.lower()
+    text = text.str.replace(PUNCTUATION, ' ', regex=True).str.strip()
+    stripped = (text.str.replace(CN_SUFFIXES, '', regex=True)
+                .str.replace(EN_SUFFIXES, '', regex=True))
+    # 名称只有后缀时保留原样
+    text = stripped.where(stripped.str.strip() != '', text)
+    return text.str.replace(' ', '', regex=False).fillna('').to_numpy(dtype=object)
+
+
+def _shingles(key):
+    '''名称键的字符n-gram：纯ASCII名称取3-gram，其余取2-gram'''
+    n = 3 if key.isascii() else 2
+    if len(key) <= n:
+        return {key}
+    return {key[i:i+n] for i in range(len(key) - n + 1)}
+
+
+def minhash(keys, shingles=None):
+    '''计算各名称键的MinHash签名，返回len(keys)×SIGNATURE_SIZE的数组'''
+    if shingles is None:
+        shingles = [_shingles(key) for key in keys]
+    lengths = np.fromiter((len(s) for s in shingles), dtype=np.int64, count=len(keys))
+    # 使用稳定的哈希函数，同一名称在不同进程中的签名相同
+    hashes = np.fromiter((zlib.crc32(g.encode('utf-8')) for s in shingles for g in s),
+                         dtype=np.int64, count=int(lengths.sum())) % _PRIME
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    signature = np.empty((len(keys), SIGNATURE_SIZE), dtype=np.int64)
+    # 每次计算8个哈希函数，控制中间数组的大小
+    for i in range(0, SIGNATURE_SIZE, 8):
+        values = (_A[i:i+8, None] * hashes[None, :] + _B[i:i+8, None]) % _PRIME
+        signature[:, i:i+8] = np.minimum.reduceat(values, starts, axis=1).T
+    return signature
+
+
+def _candidates(signature):
+    '''LSH分桶：签名在某一段上完全相同的名称互为候选，返回候选对(i, j)'''
+    n = len(signature)
+    rows = SIGNATURE_SIZE // BANDS
+    pairs = []
+    for band in range(BANDS):
+        part = signature[:, band*rows:(band+1)*rows].astype(np.uint64)
+        _, bucket = np.unique(part @ _BAND_WEIGHTS, return_inverse=True)
+        bucket = bucket.ravel()
+        order = np.argsort(bucket, kind='stable')
+        sorted_bucket = bucket[order]
+        same = sorted_bucket[1:] == sorted_bucket[:-1]
+        # 同一桶中的名称与桶中第一个名称以及前一个名称比较，避免大桶产生平方级的候选对
+        first = np.empty(n, dtype=np.int64)
+        first[order] = order[np.searchsorted(sorted_bucket, sorted_bucket)]
+        pairs.append(np.column_stack([order[1:][same], order[:-1][same]]))
+        pairs.append(np.column_stack([np.arange(n), first]))
+    pairs = np.concatenate(pairs)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    return np.unique(np.sort(pairs, axis=1), axis=0)
+
+
+def _components(n, pairs):
+    '''由相连的名称对计算连通分量，返回每个名称所在分量中最小的下标'''
+    labels = np.arange(n)
+    if not len(pairs):
+        return labels
+    i, j = pairs[:, 0], pairs[:, 1]
+    while True:
+        low = np.minimum(labels[i], labels[j])
+        merged = labels.copy()
+        np.minimum.at(merged, i, low)
+        np.minimum.at(merged, j, low)
+        merged = merged[merged]
+        if np.array_equal(merged, labels):
+            return labels
+        labels = merged
+
+
+def _jaccard(shingles, pairs):
+    '''各候选名称对的n-gram集合的Jaccard相似度'''
+    return np.fromiter(
+        (len(shingles[i] & shingles[j]) / len(shingles[i] | shingles[j]) for i, j in pairs),
+        dtype=np.float64, count=len(pairs))
+
+
+def cluster_keys(keys, threshold=None):
+    '''把相似的名称键分为一组，返回每个名称键所在组的代表下标。
+
+    MinHash签名只用于查找候选名称对，是否合并按n-gram集合的实际Jaccard相似度判断。
+    '''
+    threshold = config.name_similarity if threshold is None else threshold
+    if len(keys) < 2:
+        return np.arange(len(keys))
+    shingles = [_shingles(key) for key in keys]
+    pairs = _candidates(minhash(keys, shingles))
+    if len(pairs):
+        # 名称中的数字不同时（例如编号不同的研究所、分公司）通常是不同的申请人，不合并
+        _, digits = np.unique(pd.Series(keys, dtype=object).str.replace(r'\D+', '', regex=True)
+                              .to_numpy(dtype=str), return_inverse=True)
+        digits = digits.ravel()
+        pairs = pairs[digits[pairs[:, 0]] == digits[pairs[:, 1]]]
+        pairs = pairs[_jaccard(shingles, pairs) >= threshold]
+    return _components(len(keys), pairs)
+
+
+class NameIndex:
+    '''保存在文件中的名称与规范名称对应表'''
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._names = {}
+        self._mapping = {}
+
+    def _load(self):
+        # 文件被手工编辑后重新读取
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        table = pd.read_csv(self.path, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        names = dict(zip(table['名称'], table['规范名称']))
+        self._names = names
+        self._mapping = dict(zip(name_keys(list(names)), names.values()))
+        self._mtime = mtime
+
+    def _save(self):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        table = pd.DataFrame({'名称': list(self._names), '规范名称': list(self._names.values())})
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.csv')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8-sig', newline='') as file:
+                table.to_csv(file, index=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self._mtime = os.path.getmtime(self.path)
+
+    def resolve(self, names, weights=None, threshold=None):
+        '''返回names中各名称对应的规范名称字典。
+
+        对应表中没有的名称与已有的规范名称一起分组，与已有规范名称同组的名称使用该规范
+        名称，其余各组以weights（默认为出现次数）最大的写法作为规范名称，并写入对应表。
+        '''
+        names = pd.Series(names, dtype=object)
+        weights = (pd.Series(np.ones(len(names))) if weights is None
+                   else pd.Series(weights, dtype=float).fillna(0))
+        totals = weights.groupby(names.to_numpy(), sort=False).sum()
+        names = totals.index.to_numpy(dtype=object)
+        keys = name_keys(names)
+
+        with self._lock:
+            self._load()
+            known = np.fromiter((key in self._mapping for key in keys), dtype=bool,
+                                count=len(keys))
+            if not known.all():
+                self._learn(names[~known], keys[~known], totals.to_numpy()[~known], threshold)
+                self._save()
+            return {name: self._mapping[key] for name, key in zip(names, keys)}
+
+    def _learn(self, names, keys, weights, threshold):
+        canonical = list(dict.fromkeys(self._mapping.values()))
+        canonical_keys = name_keys(canonical)
+        unique_keys, inverse = np.unique(np.concatenate([canonical_keys, keys]),
+                                         return_inverse=True)
+        groups = cluster_keys(unique_keys, threshold)[inverse.ravel()]
+
+        display = pd.Series(names, dtype=object).str.strip(STRIP_CHARS).to_numpy(dtype=object)
+        table = pd.DataFrame({
+            'group': groups,
+            'name': np.concatenate([canonical, display]),
+            # 已有的规范名称优先
+            'weight': np.concatenate([np.full(len(canonical), np.inf), weights]),
+        })
+        best = table.sort_values('weight', ascending=False, kind='stable') \
+                    .drop_duplicates('group').set_index('group')['name']
+        for name, key, group in zip(names, keys, groups[len(canonical):]):
+            self._names[name] = self._mapping[key] = best[group]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def name_index():
+    '''返回进程内共享的名称对应表，首次调用时创建'''
+    global _index
+    with _index_lock:
+        if _index is None or _index.path != config.name_map:
+            _index = NameIndex(config.name_map)
+        return _index
+
+
+def name_map_mtime():
+    '''名称对应表文件的修改时间，文件不存在时为None'''
+    try:
+        return os.path.getmtime(config.name_map)
+    except OSError:
+        return None
+
+
+def remap(values, mapping):
+    '''按mapping字典把values中的名称替换为规范名称，返回分类类型的Series。
+
+    只对各个不同的名称查找一次，再通过分类编码整体替换。
+    '''
+    values = pd.Series(values)
+    categorical = values.astype('category')
+    categories = categorical.cat.categories
+    target = pd.Index([mapping.get(name, name) for name in categories], dtype=object)
+    codes, uniques = pd.factorize(target)
+    old = categorical.cat.codes.to_numpy()
+    new = np.where(old >= 0, codes[old], -1)
+    return pd.Series(pd.Categorical.from_codes(new, uniques), index=values.index,
+                     name=values.name)
+
+
+def normalize_names(data, column, weights=None, threshold=None):
+    '''把data中column列的名称替换为规范名称，weights为确定规范名称时使用的数值列。
+
+    返回(替换后的DataFrame, 被合并的名称数量)。
+    '''
+    values = data[column]
+    present = values.notna()
+    mapping = name_index().resolve(
+        values[present].astype(str).to_numpy(),
+        None if weights is None else data.loc[present, weights].to_numpy(),
+        threshold,
+    )
+    data = data.copy()
+    data[column] = remap(values.astype(str).where(present), mapping)
+    merged = sum(name != canonical for name, canonical in mapping.items())
+    return data, merged
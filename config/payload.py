@@ -0,0 +1,121 @@
+'''
+发送到浏览器的图表数据。
+
+st.plotly_chart把图表中的每个数值都序列化为JSON数字，气泡矩阵、桑基图等包含大量数值的
+图表每次执行都要发送和解析数MB的JSON。这里把图表trace中的数值数组编码为plotly.js支持的
+typed array（{dtype, bdata}，bdata为小端字节序数据的base64编码），JSON的体积和浏览器的
+解析耗时都大幅减少；安装orjson时plotly使用orjson序列化其余部分。
+
+编码只作用于发送：缓存的图表和导出图片时使用的图表保持原样。
+'''
+import base64
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from config import config
+
+# numpy数据类型对应的plotly.js typed array类型
+TYPED_ARRAY_TYPES = {
+    'float64': 'f8', 'float32': 'f4',
+    'int32': 'i4', 'uint32': 'u4', 'int16': 'i2', 'uint16': 'u2', 'int8': 'i1', 'uint8': 'u1',
+}
+# 整数按数值范围依次尝试的类型，都放不下时转换为float64
+_INT_TYPES = [np.iinfo(t) for t in (np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32)]
+
+
+def _narrow(array):
+    '''在不损失精度的前提下使用最小的数据类型：整数按数值范围，浮点数能精确表示时用float32'''
+    if array.dtype.kind in 'iu':
+        if not array.size:
+            return array.astype(np.int32)
+        low, high = array.min(), array.max()
+        for info in _INT_TYPES:
+            if low >= info.min and high <= info.max:
+                return array.astype(info.dtype, copy=False)
+        return array.astype(np.float64)
+    if array.dtype != np.float32:
+        single = array.astype(np.float32)
+        if np.array_equal(single, array, equal_nan=True):
+            return single
+    return array
+
+
+def typed_array(value, min_length=None):
+    '''把数值数组编码为typed array字典，不是数值数组或长度小于min_length时返回None'''
+    min_length = config.typed_array_min if min_length is None else min_length
+    if not min_length or len(value) < min_length:
+        return None
+    if isinstance(value, (list, tuple)):
+        first = value[0]
+        if isinstance(first, bool) or not isinstance(first, (int, float, np.number)):
+            return None
+        array = np.asarray(value)
+    else:
+        array = value
+    if array.ndim > 2 or array.dtype.kind not in 'iuf':
+        return None
+
+    array = _narrow(array)
+    array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+    spec = {
+        'dtype': TYPED_ARRAY_TYPES[array.dtype.name],
+        'bdata': base64.b64encode(array.data).decode('ascii'),
+    }
+    if array.ndim == 2:
+        spec['shape'] = f'{array.shape[0]}, {array.shape[1]}'
+    return spec
+
+
+def _compact(obj, counts):
+    '''返回把obj中各数值数组替换为typed array后的副本，没有替换的部分不复制'''
+    if isinstance(obj, dict):
+        items = {}
+        for key, value in obj.items():
+            new = _compact(value, counts)
+            if new is not value:
+                items[key] = new
+        return {**obj, **items} if items else obj
+    if isinstance(obj, np.ndarray) or (isinstance(obj, (list, tuple)) and obj):
+        spec = typed_array(obj)
+        if spec is not None:
+            counts['typed_arrays'] += 1
+            return spec
+        if isinstance(obj, list) and isinstance(obj[0], dict):
+            items = [_compact(item, counts) for item in obj]
+            if any(new is not item for new, item in zip(items, obj)):
+                return items
+    return obj
+
+
+def compact_spec(spec):
+    '''把图表字典中各trace（包括动画帧）的数值数组编码为typed array，返回(新字典, 编码的数组数)。
+
+    layout中的range、domain等属性要求普通数组，保持不变。
+    '''
+    counts = {'typed_arrays': 0}
+    spec = dict(spec)
+    spec['data'] = [_compact(trace, counts) for trace in spec.get('data', ())]
+    if spec.get('frames'):
+        spec['frames'] = [
+            {**frame, 'data': [_compact(trace, counts) for trace in frame.get('data', ())]}
+            for frame in spec['frames']
+        ]
+    return spec, counts['typed_arrays']
+
+
+def compact_figure(figure):
+    '''返回(只用于发送的图表, 编码的数组数)，图表中的数值数组编码为typed array。
+
+    plotly 5还不接受typed array形式的属性值，这里以_validate=False构建图表，不校验各属性；
+    st.plotly_chart对Figure对象不再校验，直接序列化to_dict()的结果。
+    '''
+    spec = figure.to_dict() if isinstance(figure, go.Figure) else figure
+    spec, typed_arrays = compact_spec(spec)
+    return go.Figure(spec, _validate=False), typed_arrays
+
+
+def payload_bytes(figure):
+    '''发送的图表JSON的字节数'''
+    return len(pio.to_json(figure, validate=False).encode('utf-8'))
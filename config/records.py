@@ -0,0 +1,213 @@
+'''
+原始记录数据的整理。
+
+专利数据库导出的原始数据每行表示一件专利，申请人、IPC分类号等字段常常在一个单元格中
+用分号分隔多个值。这里把多值字段向量化地拆分展开为多条记录并保存为分类类型，再按所选
+维度一次分组计数，得到趋势、构成和排名页面所需的“长”格式汇总表。大文件可以分块汇总，
+每块计数后与累计结果合并，内存中只保留各分组的部分计数。
+
+申请日、优先权日等日期字段先按月一次分组计数(count_months)，再由逐月计数切换为年、季度
+或月份的统计周期并计算增长率(bin_months)，改变统计周期或截除的月数时不必重新读取原始记录。
+'''
+import re
+
+import numpy as np
+import pandas as pd
+
+SEPARATORS = ';；'
+RECORD_ID = '__record__'
+COUNT = '申请量(项)'
+MONTH = '__month__'
+# 各统计周期包含的月数，以及汇总表中周期列的列名
+PERIODS = {'year': 12, 'quarter': 3, 'month': 1}
+PERIOD_NAMES = {'year': '年份', 'quarter': '季度', 'month': '月份'}
+YOY = '同比增长率'
+CAGR = '年均复合增长率'
+
+
+def explode_records(data, fields, sep=SEPARATORS):
+    '''把fields中的多值字段按sep中的任一字符拆分展开，每个值一行，并转换为分类类型。
+
+    返回的DataFrame中RECORD_ID列记录每行对应的原始记录序号。
+    '''
+    records = data.reset_index(drop=True)
+    records.insert(0, RECORD_ID, records.index)
+    pattern = f'[{re.escape(sep)}]'
+    for field in fields:
+        records[field] = records[field].astype('string').str.split(pattern, regex=True)
+        records = records.explode(field, ignore_index=True)
+        records[field] = records[field].str.strip()
+        # 去掉缺失值和末尾分隔符产生的空字符串
+        records = records.loc[records[field].fillna('') != '']
+    for field in fields:
+        records[field] = records[field].astype('category')
+    return records.reset_index(drop=True)
+
+
+def count_records(records, by, name=COUNT):
+    '''按by中的维度分组计数，同一原始记录在同一分组中只计一次'''
+    if RECORD_ID in records:
+        records = records.drop_duplicates(subset=[RECORD_ID, *by])
+    table = records.groupby(by, observed=True, sort=True).size()
+    return table.rename(name).reset_index()
+
+
+def aggregate_records(data, by, multi=(), sep=SEPARATORS, name=COUNT):
+    '''拆分多值字段后按维度计数，返回“长”格式汇总表'''
+    multi = [field for field in multi if field in by]
+    records = explode_records(data[list(by)], multi, sep)
+    return count_records(records, list(by), name)
+
+
+def aggregate_chunks(chunks, by, multi=(), sep=SEPARATORS, name=COUNT):
+    '''逐块拆分计数并累加各分组的部分计数，结果与对全部数据调用aggregate_records相同。
+
+    同一条原始记录总在同一块中，因此按块去重计数后直接相加即可。
+    '''
+    by = list(by)
+    table = None
+    for chunk in chunks:
+        counts = aggregate_records(chunk, by, multi, sep, name)
+        if table is None:
+            table = counts
+            continue
+        table = (pd.concat([table, counts], ignore_index=True)
+                 .groupby(by, observed=True, sort=False)[name].sum()
+                 .reset_index())
+    if table is None:
+        return pd.DataFrame(columns=[*by, name])
+
+    table = table.sort_values(by, ignore_index=True)
+    for field in multi:
+        if field in by:
+            table[field] = table[field].astype('category')
+    return table
+
+
+def parse_dates(values):
+    '''把日期列解析为datetime64。
+
+    支持2019-03-15、2019/3/15、2019.03.15、2019年3月15日、20190315以及2019-03等格式，
+    无法解析的值为NaT。
+    '''
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_numeric_dtype(values):
+        values = values.astype('Int64')
+    text = values.astype('string').str.strip()
+    # 常见的ISO格式（包括20190315）直接解析，其余格式统一分隔符后再解析
+    dates = pd.to_datetime(text, format='ISO8601', errors='coerce')
+    rest = dates.isna() & text.notna()
+    if rest.any():
+        other = text[rest].str.replace(r'[./年月]', '-', regex=True).str.rstrip('日')
+        dates[rest] = pd.to_datetime(other, format='%Y-%m-%d', errors='coerce')
+    return dates
+
+
+def _month_chunk(chunk, date, color):
+    '''把日期转换为自1970年1月起的月份序号，去掉无法解析的日期'''
+    dates = parse_dates(chunk[date])
+    valid = dates.notna().to_numpy()
+    months = dates[valid].to_numpy(dtype='datetime64[ns]').astype('datetime64[M]').astype(np.int64)
+    frame = pd.DataFrame({MONTH: months})
+    if color is not None:
+        frame.insert(0, color, chunk[color].to_numpy()[valid])
+    return frame
+
+
+def count_months(chunks, date, color=None, multi=False, sep=SEPARATORS, name=COUNT):
+    '''按月份（以及color中的数据系列）逐块分组计数，返回(color, MONTH, name)列的汇总表。
+
+    multi为True时color按sep拆分为多个值，同一记录在每个值中分别计数。
+    '''
+    by = [MONTH] if color is None else [color, MONTH]
+    months = (_month_chunk(chunk, date, color) for chunk in chunks)
+    return aggregate_chunks(months, by, [color] if multi and color else (), sep, name)
+
+
+def _period_label(months, period):
+    years, rest = np.divmod(months, 12)
+    years = years + 1970
+    if period == 'year':
+        return years
+    if period == 'quarter':
+        return [f'{y}Q{q}' for y, q in zip(years, rest // 3 + 1)]
+    return [f'{y}-{m:02d}' for y, m in zip(years, rest + 1)]
+
+
+def bin_months(counts, period='year', cutoff=18, color=None, name=COUNT):
+    '''把count_months()的逐月计数汇总为period统计周期，并计算各数据系列的增长率。
+
+    最近cutoff个月（以数据中最晚的月份为准，例如专利申请公开的滞后期）的记录不完整，
+    予以截除；截除后不完整的统计周期也一并去掉。返回(汇总表, 增长率表)：汇总表每行为一个
+    数据系列在一个周期中的计数和同比增长率，增长率表为各数据系列按完整年份计算的年均复合
+    增长率。
+    '''
+    step = PERIODS[period]
+    label = PERIOD_NAMES[period]
+    months = counts[MONTH].to_numpy(dtype=np.int64)
+    if color is None:
+        codes, series = np.zeros(len(counts), dtype=np.int64), pd.Index([None])
+    else:
+        codes, series = pd.factorize(counts[color], sort=True)
+
+    columns = [label, *([color] if color else []), name, YOY]
+    growth_columns = [*([color] if color else []), '起始年份', '结束年份', CAGR]
+    if not len(months):
+        return pd.DataFrame(columns=columns), pd.DataFrame(columns=growth_columns)
+
+    # 从第一年的1月到截除前的最后一个月，构建各数据系列逐月计数的矩阵
+    start = months.min() // 12 * 12
+    end = months.max() + 1 - cutoff
+    width = max(end - start, 0)
+    matrix = np.zeros((len(series), width))
+    kept = months < end
+    np.add.at(matrix, (codes[kept], months[kept] - start), counts[name].to_numpy()[kept])
+
+    def rebin(step):
+        n = width // step
+        return matrix[:, :n*step].reshape(len(series), n, step).sum(axis=2)
+
+    binned = rebin(step)
+    # 截除后没有完整的统计周期
+    if not binned.shape[1]:
+        return pd.DataFrame(columns=columns), pd.DataFrame(columns=growth_columns)
+    lag = 12 // step
+    yoy = np.full(binned.shape, np.nan)
+    previous = binned[:, :-lag]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        yoy[:, lag:] = np.where(previous > 0, binned[:, lag:] / previous - 1, np.nan)
+
+    n = binned.shape[1]
+    table = pd.DataFrame({
+        label: np.tile(_period_label(start + np.arange(n)*step, period), len(series)),
+        name: binned.ravel(),
+        YOY: yoy.ravel(),
+    })
+    if color is not None:
+        table.insert(1, color, np.repeat(series.to_numpy(), n))
+    table[name] = table[name].astype(np.int64)
+    # 去掉数据系列首次出现之前的空周期
+    first = np.argmax(binned > 0, axis=1)
+    table = table.loc[np.arange(n)[None, :].repeat(len(series), 0).ravel()
+                      >= np.repeat(first, n)].reset_index(drop=True)
+
+    # 年均复合增长率：各数据系列第一个非零年份到最后一个完整年份
+    years = rebin(12)
+    growth = pd.DataFrame(columns=growth_columns)
+    if years.shape[1]:
+        first_year = np.argmax(years > 0, axis=1)
+        last_year = years.shape[1] - 1
+        first_value = years[np.arange(len(series)), first_year]
+        span = last_year - first_year
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cagr = np.where((first_value > 0) & (span > 0),
+                            (years[:, -1] / first_value) ** (1 / span) - 1, np.nan)
+        growth = pd.DataFrame({
+            '起始年份': first_year + start // 12 + 1970,
+            '结束年份': np.full(len(series), last_year + start // 12 + 1970),
+            CAGR: cagr,
+        })
+        if color is not None:
+            growth.insert(0, color, series.to_numpy())
+    return table, growth
@@ -0,0 +1,138 @@
+'''
+绘图数据源。
+
+页面先根据数据源的列名生成各个选择框，选定之后再通过frame()取出绘图所需的列。上传的
+Parquet和Arrow/Feather文件据此只读取和解码被选中的列，CSV和Excel文件仍完整解析一次
+后缓存；Excel文件的工作表名称和尺寸按上传内容缓存，预览直接取自已解析的工作表。超过
+config.stream_upload_mb的大文件在原始记录汇总时通过chunks()分块读取，不必把全部记录
+解析到内存中。
+'''
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+import pandas as pd
+
+from config import config
+from config.cache import upload_cache, digest
+from config.timing import stage, frame_info
+from config.loader import (
+    COLUMNAR, sniff_format, excel_sheets, read_columns, read_preview, read_data, iter_chunks,
+)
+
+# 缓存工作表元数据的上传文件数量
+SHEET_CACHE_SIZE = 64
+_sheets = OrderedDict()
+_sheets_lock = threading.Lock()
+
+
+def workbook_sheets(content, key=None):
+    '''返回Excel文件各工作表的(名称, 行数, 列数)，其他格式返回空列表。
+
+    按上传内容的哈希值key缓存，每个文件只读取一次工作簿元数据。
+    '''
+    key = key or digest(content)
+    with _sheets_lock:
+        if key in _sheets:
+            _sheets.move_to_end(key)
+            return _sheets[key]
+    sheets = excel_sheets(content)
+    with _sheets_lock:
+        _sheets[key] = sheets
+        while len(_sheets) > SHEET_CACHE_SIZE:
+            _sheets.popitem(last=False)
+    return sheets
+
+
+def _unique(columns):
+    '''去掉重复和空的列名，保持原有顺序'''
+    return tuple(dict.fromkeys(column for column in columns if column is not None))
+
+
+class Table:
+    '''内存中的DataFrame数据源，例如原始记录汇总后的数据'''
+
+    def __init__(self, data, key=None):
+        self.data = data
+        self.key = key
+        self.columns = data.columns
+
+    def preview(self, nrows=3):
+        return self.data.head(nrows)
+
+    def frame(self, columns=None):
+        '''返回包含columns中各列的DataFrame，columns为None时返回全部数据'''
+        if columns is None:
+            return self.data
+        return self.data[list(_unique(columns))]
+
+    def chunks(self, columns=None):
+        yield self.frame(columns)
+
+
+class Upload:
+    '''上传的数据文件，key为(内容哈希, 工作表)。
+
+    列式格式的文件只读取元数据中的列名，按所选的列分别读取并缓存；其他格式完整读取后
+    缓存，再从中选取所需的列。
+    '''
+
+    def __init__(self, content, sheet=None, content_key=None):
+        self.content = content
+        self.key = (content_key or digest(content), sheet)
+        self.sheet = sheet
+        self.format = fmt = sniff_format(content)
+        self.columnar = fmt in COLUMNAR
+        self.streaming = (fmt not in ('xlsx', 'xls')
+                          and len(content) >= config.stream_upload_mb * 2**20)
+
+    @cached_property
+    def columns(self):
+        # 列式格式只需读取文件尾部的元数据，需要分块读取的大文件只读取表头
+        if self.columnar or (self.streaming and upload_cache.get(self.key) is None):
+            return pd.Index(read_columns(self.content, self.sheet))
+        return self._full().columns
+
+    def _parse(self, columns=None):
+        with stage('parse', format=self.format, file_bytes=len(self.content)) as info:
+            data = read_data(self.content, self.sheet, columns)
+            info.update(frame_info(data))
+        return data
+
+    def _full(self):
+        return upload_cache.get_or_parse(self.key, self._parse)
+
+    def preview(self, nrows=3):
+        data = upload_cache.get(self.key)
+        if data is not None:
+            return data.head(nrows)
+        if self.format in ('xlsx', 'xls'):
+            # 打开工作簿的开销远大于读取数据，直接解析完整的工作表并缓存
+            return self._full().head(nrows)
+        return read_preview(self.content, self.sheet, nrows)
+
+    def frame(self, columns=None):
+        '''返回包含columns中各列的DataFrame，columns为None时返回全部数据'''
+        if columns is None:
+            return self._full()
+        columns = _unique(columns)
+        if not self.columnar:
+            return self._full()[list(columns)]
+        data = upload_cache.get(self.key)
+        if data is not None:
+            return data[list(columns)]
+        return upload_cache.get_or_parse(
+            (*self.key, 'columns', columns),
+            lambda: self._parse(list(columns)),
+        )
+
+    def chunks(self, columns=None):
+        '''依次返回包含columns中各列的DataFrame。
+
+        大文件尚未完整解析时按config.chunk_rows行分块读取，否则只返回一块完整数据。
+        '''
+        if not self.streaming or upload_cache.get(self.key) is not None:
+            yield self.frame(columns)
+            return
+        columns = list(_unique(columns)) if columns is not None else None
+        yield from iter_chunks(self.content, columns, config.chunk_rows, self.sheet)
@@ -0,0 +1,116 @@
+'''
+页面执行各阶段的耗时记录。
+
+页面每次执行开始时调用start_run()，之后数据解析、图表构建、图表发送和图片导出等阶段
+用stage()记录耗时和数据规模。每个阶段以一行JSON写入patentvis.timing日志，设置环境变量
+PATENTVIS_TIMING_LOG=1时输出到标准错误；同一次执行的记录保存在RunTimer中，供诊断面板
+展示。本模块不依赖streamlit，在命令行脚本中使用时只输出日志。
+'''
+import contextvars
+import json
+import logging
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from config import config
+
+logger = logging.getLogger('patentvis.timing')
+if config.timing_log and not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_current = contextvars.ContextVar('patentvis_run', default=None)
+
+
+def _log(page, entry):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'page': page, **entry}, ensure_ascii=False, default=str))
+
+
+class RunTimer:
+    '''一次页面执行中各阶段的耗时记录'''
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.time()
+        self.total = None
+        self.stages = []
+        self._start = time.perf_counter()
+
+    def record(self, name, seconds, **fields):
+        entry = {'stage': name, 'seconds': round(seconds, 4), **fields}
+        self.stages.append(entry)
+        _log(self.page, entry)
+
+    def finish(self):
+        '''记录本次执行的总耗时'''
+        self.total = time.perf_counter() - self._start
+        _log(self.page, {'stage': 'run', 'seconds': round(self.total, 4)})
+        return self.total
+
+    def totals(self):
+        '''返回各阶段累计耗时(秒)的字典'''
+        totals = defaultdict(float)
+        for entry in self.stages:
+            totals[entry['stage']] += entry['seconds']
+        return dict(totals)
+
+
+def start_run(page):
+    '''开始记录一次页面执行，返回RunTimer'''
+    timer = RunTimer(page)
+    _current.set(timer)
+    return timer
+
+
+def current_run():
+    return _current.get()
+
+
+def frame_info(data):
+    '''DataFrame的行数、列数和占用内存字节数（不统计字符串对象本身）'''
+    return {
+        'rows': len(data),
+        'columns': data.shape[1],
+        'bytes': int(data.memory_usage(index=True, deep=False).sum()),
+    }
+
+
+@contextmanager
+def stage(name, **fields):
+    '''记录with语句块的耗时，yield出的字典可以补充行数、字节数等信息'''
+    timer = _current.get()
+    info = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        seconds = time.perf_counter() - start
+        if timer is not None:
+            timer.record(name, seconds, **info)
+        else:
+            _log(None, {'stage': name, 'seconds': round(seconds, 4), **info})
+
+
+def timed(name, func, **fields):
+    '''包装延迟执行的func（例如下载按钮的数据回调），执行时把耗时和返回结果的字节数记录到
+    创建它的那次页面执行中'''
+    timer = _current.get()
+
+    def wrapper():
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        info = dict(fields, bytes=len(result))
+        if timer is not None:
+            timer.record(name, seconds, **info)
+        else:
+            _log(None, {'stage': name, 'seconds': round(seconds, 4), **info})
+        return result
+
+    return wrapper
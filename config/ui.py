@@ -0,0 +1,314 @@
+'''
+各页面共用的streamlit界面组件。
+'''
+import time
+from collections import deque
+from functools import partial
+
+import pandas as pd
+import streamlit as st
+
+from config import config
+from config.cache import upload_cache, digest
+from config.records import (
+    SEPARATORS, CAGR, aggregate_chunks, count_months, bin_months,
+)
+from config.source import Upload, Table, workbook_sheets
+from config.timing import start_run, current_run, stage, frame_info, timed
+from config.export import export_bundle
+from config.payload import compact_figure, payload_bytes
+from config.names import normalize_names, name_map_mtime
+
+# 文件上传控件接受的文件类型
+UPLOAD_TYPES = ['csv', 'xlsx', 'xls', 'parquet', 'feather', 'arrow']
+UPLOAD_HELP = '上传CSV、Excel、Parquet或Arrow/Feather格式的数据文件，其他格式数据暂不支持'
+
+# 会话中保存最近几次页面执行耗时记录的键
+RUNS_KEY = '_patentvis_runs'
+# 诊断面板中各阶段的显示顺序
+STAGES = {'parse': '解析', 'records': '汇总', 'build': '构建', 'send': '发送', 'export': '导出'}
+# 按日期统计时统计周期的显示名称
+PERIOD_LABELS = {'year': '年', 'quarter': '季度', 'month': '月'}
+# 导出SVG图片时的字体处理方式
+SVG_FONTS = {'embed': '嵌入字体子集', 'path': '文字转为路径', 'none': '不处理'}
+# 分面图表的导出方式
+FACET_EXPORTS = {'combined': '合并为一张图片', 'separate': '每个分面单独导出(ZIP)'}
+# 会话中保存导出清单的键，导出清单在各页面之间共享
+BUNDLE_KEY = '_patentvis_bundle'
+
+
+def begin_run(page):
+    '''开始记录本次页面执行的各阶段耗时，并加入本会话的执行历史'''
+    timer = start_run(page)
+    runs = st.session_state.get(RUNS_KEY)
+    if runs is None:
+        runs = st.session_state[RUNS_KEY] = deque(maxlen=config.diagnostics_runs)
+    runs.append(timer)
+    return timer
+
+
+def finish_run():
+    '''记录本次页面执行的总耗时；开启诊断面板时在侧边栏展示最近几次执行的各阶段耗时'''
+    timer = current_run()
+    if timer is None:
+        return
+    timer.finish()
+    if not config.diagnostics:
+        return
+
+    rows = []
+    for run in reversed(st.session_state.get(RUNS_KEY, ())):
+        totals = run.totals()
+        rows.append({
+            '时间': time.strftime('%H:%M:%S', time.localtime(run.started)),
+            '页面': run.page,
+            **{label: round(totals[name] * 1000) if name in totals else None
+               for name, label in STAGES.items()},
+            '总计': round(run.total * 1000) if run.total is not None else None,
+        })
+    with st.sidebar.expander('⏱️ 性能诊断', expanded=True):
+        st.caption(f'本会话最近{len(rows)}次页面执行的各阶段耗时(毫秒)，导出耗时记在生成下载按钮的那次执行中')
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        st.caption('本次执行明细')
+        st.dataframe(pd.DataFrame(timer.stages), use_container_width=True, hide_index=True)
+
+
+def load_upload(file_uploaded, sheet_select, data_display):
+    '''读取上传的文件，在data_display中展示前3行数据。
+
+    返回Upload数据源，绘图时再通过frame()取出所选的列。
+    '''
+    content = file_uploaded.getvalue()
+    key = digest(content)
+
+    sheet = None
+    sheets = {name: (rows, cols) for name, rows, cols in workbook_sheets(content, key)}
+    if sheets:
+        sheet = sheet_select.selectbox(
+            '🧾**读取哪一个工作表？**', options=list(sheets),
+            index=0, help='默认选中第一个工作表，已读取过的工作表切换回来时无需重新解析',
+            format_func=lambda name: _sheet_label(name, *sheets[name]),
+        )
+
+    # CSV文件预览只读取前几行，不必等待完整解析结束
+    upload = Upload(content, sheet, key)
+    with data_display.container():
+        st.markdown('读取数据前3行展示：')
+        st.dataframe(upload.preview(3), use_container_width=True, hide_index=True)
+    return upload
+
+
+def _sheet_label(name, rows, cols):
+    if rows is None:
+        return name
+    return f'{name}（{rows}行×{cols}列）'
+
+
+def record_table(source):
+    '''原始记录模式：把每行一件专利的原始数据拆分多值字段后分组计数。
+
+    未开启原始记录模式或尚未选择分组字段时原样返回source，否则返回汇总结果的Table
+    数据源；汇总结果按上传文件和所选字段缓存，同一份上传数据可以直接供各页面的各类
+    图表使用。
+    '''
+    with st.expander('##### 原始记录汇总（上传每行一件专利的原始数据时使用）'):
+        if not st.toggle('按原始记录汇总', help='开启后按所选字段统计专利数量，得到绘图所需的“长”格式数据'):
+            return source
+
+        bycol, multicol, sepcol = st.columns([2, 2, 1])
+        by = bycol.multiselect(
+            '分组字段*', options=source.columns,
+            placeholder='统计维度，例如年份、申请人...',
+        )
+        multi = multicol.multiselect(
+            '多值字段', options=by,
+            placeholder='一个单元格包含多个值的字段...',
+            help='例如申请人、IPC分类号等字段，拆分后每个值分别计数，同一件专利在同一分组中只计一次',
+        )
+        sep = sepcol.text_input('多值分隔符', value=SEPARATORS,
+                                help='其中任一字符均作为分隔符')
+        if not by:
+            st.info('请选择分组字段')
+            return source
+
+        key = (*source.key, 'records', tuple(by), tuple(multi), sep)
+        table = upload_cache.get_or_parse(key, lambda: _aggregate(source, by, multi, sep))
+        st.markdown(f'汇总后共{len(table)}行，前3行展示：')
+        st.dataframe(table.head(3), use_container_width=True, hide_index=True)
+    return Table(table, key)
+
+
+def _aggregate(source, by, multi, sep):
+    with stage('records', streaming=getattr(source, 'streaming', False)) as info:
+        table = aggregate_chunks(source.chunks(by), by, multi, sep or SEPARATORS)
+        info.update(frame_info(table))
+    return table
+
+
+def date_table(source):
+    '''按日期统计：把原始记录中的申请日、优先权日等日期字段按年、季度或月份计数。
+
+    未开启或尚未选择日期字段时原样返回source，否则返回统计结果的Table数据源。逐月计数按
+    上传文件和所选字段缓存，切换统计周期或截除月数时直接由缓存的逐月计数重新汇总。
+    '''
+    with st.expander('##### 按日期统计（上传带有申请日、优先权日等日期的原始数据时使用）'):
+        if not st.toggle('按日期统计', help='开启后按所选日期字段统计每年、每季度或每月的专利数量'):
+            return source
+
+        datecol, colorcol, multicol = st.columns([2, 2, 1])
+        date = datecol.selectbox(
+            '日期字段*', options=source.columns, index=None,
+            placeholder='申请日、优先权日、公开日...',
+        )
+        color = colorcol.multiselect(
+            '数据系列字段', options=source.columns, max_selections=1,
+            placeholder='例如国家、申请人...',
+            help='按该字段分别统计，绘制多数据系列趋势图；不选择时统计全部记录',
+        )
+        multi = multicol.checkbox('多值字段', help=f'数据系列字段中的多个值用{SEPARATORS}分隔时勾选')
+        periodcol, cutoffcol = st.columns(2)
+        period = periodcol.radio(
+            '统计周期', options=list(PERIOD_LABELS), format_func=PERIOD_LABELS.get,
+            horizontal=True,
+        )
+        cutoff = cutoffcol.number_input(
+            '截除最近月数', min_value=0, max_value=None, value=18, step=1,
+            help=('专利申请一般在申请日（优先权日）起18个月后才公开，以数据中最晚的日期为准截除'
+                  '最近若干个月不完整的数据，截除后不完整的统计周期也一并去掉'),
+        )
+        if date is None:
+            st.info('请选择日期字段')
+            return source
+
+        c = color[0] if color else None
+        key = (*source.key, 'months', date, c, multi)
+        counts = upload_cache.get_or_parse(key, lambda: _count_months(source, date, c, multi))
+        table, growth = bin_months(counts, period, cutoff, c)
+        st.markdown(f'统计后共{len(table)}行，前3行展示：')
+        st.dataframe(table.head(3), use_container_width=True, hide_index=True)
+        if len(growth):
+            st.markdown('各数据系列的年均复合增长率：')
+            st.dataframe(
+                growth, use_container_width=True, hide_index=True,
+                column_config={CAGR: st.column_config.NumberColumn(format='percent')},
+            )
+    return Table(table, (*key, period, cutoff))
+
+
+def _count_months(source, date, color, multi):
+    with stage('records', streaming=getattr(source, 'streaming', False)) as info:
+        counts = count_months(source.chunks([date, color]), date, color, multi)
+        info.update(frame_info(counts))
+    return counts
+
+
+def name_table(source, data, column, weights=None):
+    '''申请人名称归一化：把data中column列的名称替换为规范名称，返回(DataFrame, 合并的名称数量)。
+
+    结果按上传文件、所选的列和名称对应表文件的修改时间缓存，对应表没有变化时直接复用。
+    '''
+    key = (*source.key, 'names', tuple(data.columns), column, weights)
+    with stage('records', step='names') as info:
+        table = upload_cache.get((*key, name_map_mtime()))
+        info['cached'] = table is not None
+        if table is None:
+            table, merged = normalize_names(data, column, weights)
+            table.attrs['merged'] = merged
+            # 首次归一化时写入了对应表，按写入后的修改时间缓存
+            upload_cache.put((*key, name_map_mtime()), table)
+    return table, table.attrs['merged']
+
+
+def send_chart(fig, save_config=None):
+    '''把plotly图表发送到浏览器，数值数组编码为typed array。
+
+    开启诊断面板或耗时日志时记录发送的JSON字节数。
+    '''
+    with stage('send') as info:
+        figure, info['typed_arrays'] = compact_figure(fig)
+        st.plotly_chart(figure, use_container_width=False, theme=None, config=save_config)
+        if config.diagnostics or config.timing_log:
+            info['payload_bytes'] = payload_bytes(figure)
+
+
+def facet_option(columns):
+    '''选择分面列和每行的子图数量，返回(分面列, 每行子图数)，不分面时分面列为None'''
+    facetcol, colscol = st.columns(2)
+    facet = facetcol.multiselect(
+        '分面数据', options=columns,
+        placeholder='拆分子图对应的数据...', max_selections=1,
+        help='按该列的取值把数据拆分为共用坐标轴的多个子图，例如按国家或IPC小类分别绘制，无需分多次上传和导出',
+    )
+    facet_cols = colscol.number_input(
+        '每行子图数', min_value=1, max_value=8, value=config.facet_cols, step=1,
+        disabled=not facet,
+    )
+    return (facet[0] if facet else None), facet_cols
+
+
+def facet_count(data, facet):
+    '''返回显示的分面数量，分面超过config.facet_max个时提示只显示其中一部分'''
+    count = data[facet].nunique()
+    if count > config.facet_max:
+        st.caption(f'共有{count}个分面，只显示数值合计最大的前{config.facet_max}个')
+    return min(count, config.facet_max)
+
+
+def facet_export_option(facet):
+    '''分面图表选择导出为一张图片还是每个分面单独导出，返回是否单独导出'''
+    if facet is None:
+        return False
+    options = list(FACET_EXPORTS)
+    return st.radio(
+        '分面图片导出方式', options=options, format_func=FACET_EXPORTS.get, horizontal=True,
+        help='单独导出时每个分面使用上面设置的图片宽度和高度，各自调整坐标轴范围',
+    ) == 'separate'
+
+
+def svg_font_option(ext):
+    '''导出SVG图片时选择字体的处理方式，其他格式返回None'''
+    if ext != 'svg':
+        return None
+    options = list(SVG_FONTS)
+    return st.radio(
+        'SVG图片字体', options=options,
+        index=options.index(config.svg_fonts) if config.svg_fonts in options else 0,
+        format_func=SVG_FONTS.get, horizontal=True,
+        help=('嵌入字体子集：图片中只嵌入用到的字符，在没有安装该字体的电脑上也能正常显示；'
+              '文字转为路径：文字不能再编辑，但不依赖任何字体'),
+    )
+
+
+def bundle_button(name, fig):
+    '''显示“加入导出清单”按钮，点击后把当前图表加入本会话的导出清单。
+
+    Plotly图表以JSON字符串保存，之后页面上的修改不会影响清单中的图表。
+    '''
+    if not st.button('加入导出清单', help='加入清单的图表可以在侧边栏中一次导出为SVG和PNG图片'):
+        return
+    items = st.session_state.setdefault(BUNDLE_KEY, {})
+    if hasattr(fig, 'savefig'):
+        items[(name, id(fig))] = (name, fig)
+    else:
+        fig_json = fig.to_json()
+        items[(name, digest(fig_json.encode('utf-8')))] = (name, fig_json)
+    st.toast(f'已加入导出清单：{name}')
+
+
+def bundle_panel():
+    '''在侧边栏展示导出清单和“导出全部”按钮，清单为空时不显示'''
+    items = st.session_state.get(BUNDLE_KEY)
+    if not items:
+        return
+    with st.sidebar.expander(f'📦 导出清单（{len(items)}个图表）', expanded=True):
+        st.markdown('\n'.join(f'{i}. {name}' for i, (name, _) in enumerate(items.values(), 1)))
+        exportcol, clearcol = st.columns(2)
+        # 只有点击下载时才并行渲染全部图片
+        exportcol.download_button(
+            '导出全部', file_name='图表.zip', mime='application/zip',
+            data=timed('export', partial(export_bundle, list(items.values())), format='zip'),
+            help='把清单中的每个图表导出为SVG和PNG图片，打包为一个ZIP文件',
+        )
+        if clearcol.button('清空清单'):
+            items.clear()
+            st.rerun()
@@ -1,15 +1,25 @@
+from functools import partial
+
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 import plotly.io as pio
 
-from config import config
-from config.config import blue, red, df
+from config.config import df
+from config.ui import (
+    UPLOAD_TYPES, UPLOAD_HELP, load_upload, record_table, date_table, begin_run, finish_run,
+    svg_font_option, send_chart, bundle_button, bundle_panel,
+    facet_option, facet_count, facet_export_option,
+)
+from config.timing import timed
+from config.export import export_image
+from config.records import COUNT, PERIOD_NAMES
+from charts import line_trend, area_trend, bar_trend
+from charts.facet import facet_height, export_facets
 
 st.set_page_config(
     page_title='趋势类绘图', page_icon='📈',
     layout='wide'
 )
+begin_run('趋势类绘图')
 
 pio.templates.default = 'plotly_white+mytheme'
 
@@ -25,7 +35,7 @@ st.markdown("**注意**：上传的数据格式请参照后面的示例，总体
 
 
 file_uploaded = st.file_uploader(
-    '**上传CSV数据文件**', type=['csv', 'xlsx', 'xls'], help='上传CSV或excel文件格式的数据文件，其他格式数据暂不支持')
+    '**上传数据文件**', type=UPLOAD_TYPES, help=UPLOAD_HELP)
 
 sheet_select = st.empty()
 data_display = st.empty()
@@ -65,30 +75,6 @@ save_config ={
 }
 
 
-def line_trend(data, x='年份', y='申请量(项)', color=None,
-                 width=width, height=height):
-    if color is None:
-        return px.line(data, x=x, y=y, width=width, height=height,)
-    
-    return px.line(data, x=x, y=y, color=color, width=width, height=height)
-
-
-def area_trend(data, x='年份', y='申请量(项)', color=None,
-                 width=width, height=0.618*width):
-    if color is None:
-        return px.area(data, x=x, y=y, width=width, height=height,)
-    
-    return px.area(data, x=x, y=y, color=color, width=width, height=height)
-
-
-def bar_trend(data, x, y, color=None, barmode='relative',
-              width=width, height=0.618*width):
-    if color is None:
-        return px.bar(data, x=x, y=y, width=width, height=height)
-
-    return px.bar(data, x=x, y=y, color=color, barmode=barmode, 
-                  width=width, height=height)
-
 trend = {
     'line_plot': line_trend,
     'area_plot': area_trend,
@@ -96,20 +82,14 @@ trend = {
 }
 
 if file_uploaded is not None:
-    try:
-        data = pd.read_csv(file_uploaded)
-    except:
-        xl = pd.ExcelFile(file_uploaded)
-        sheet = sheet_select.selectbox(
-            '🧾**读取哪一个工作表？**', options=xl.sheet_names,
-            index=0, help='默认选中第一个工作表'
-        )
-        data = xl.parse(sheet)
-    with data_display.container():
-        st.markdown('读取数据前3行展示：')
-        st.dataframe(data.head(3), use_container_width=True, hide_index=True)
+    upload = load_upload(file_uploaded, sheet_select, data_display)
+    source = date_table(upload)
+    # 按日期统计时直接选中统计结果中的周期、计数和数据系列列
+    dated = source is not upload
+    if not dated:
+        source = record_table(upload)
 
-    columns = data.columns
+    columns = source.columns
 
     with st.expander('##### 绘图区 (带*号为必选)', expanded=True):
         xcol, ycol, colorcol = st.columns(3)
@@ -117,21 +97,31 @@ if file_uploaded is not None:
             'X轴数据*', options=columns,
             placeholder='X轴对应的数据...',
             max_selections=1,
+            default=columns[:1] if dated else None,
         )
         y = ycol.multiselect(
             'Y轴数据*', options=columns, 
             placeholder='Y轴对应的数据...',
             max_selections=1,
+            default=[COUNT] if dated else None,
         )
         color = colorcol.multiselect(
             '颜色数据', options=columns,
             placeholder='颜色对应的数据...',
             max_selections=1,
             help='颜色选项用于绘制多数据系列趋势图',
+            default=columns[1:2] if dated and len(columns) > 3 else None,
         )
+        facet, facet_cols = facet_option(columns)
         
-        if x and y:
+        if dated and source.data.empty:
+            st.info('截除最近月数后没有完整的统计周期，请减少截除月数或选择较短的统计周期')
+        elif x and y:
             c = color[0] if color else None
+            data = source.frame([x[0], y[0], c, facet])
+            fig_height = height
+            if facet is not None:
+                fig_height = facet_height(facet_count(data, facet), facet_cols, height)
             if trend_type == 'bar_plot':
                 barmode = st.radio(
                     '多数据系列柱形图类型：',
@@ -139,20 +129,27 @@ if file_uploaded is not None:
                     format_func=lambda x: '簇状' if x=='group' else '堆叠',
                     horizontal=True,
                 )
-                fig = trend[trend_type](data, x[0], y[0], c, barmode)
+                fig = trend[trend_type](data, x[0], y[0], c, barmode,
+                                        facet=facet, facet_cols=facet_cols,
+                                        width=width, height=fig_height)
             else:
-                fig = trend[trend_type](data, x[0], y[0], c)
+                fig = trend[trend_type](data, x[0], y[0], c,
+                                        facet=facet, facet_cols=facet_cols,
+                                        width=width, height=fig_height)
                 
+            # 季度和月份的刻度较多，由plotly自动选择刻度间隔
+            many = x[0] in (PERIOD_NAMES['quarter'], PERIOD_NAMES['month'])
+            # 分面时每个子图都有各自的X轴
+            fig.update_xaxes(tickmode='auto' if many else 'linear')
             fig.update_layout(
                 plot_bgcolor='white',
-                xaxis_tickmode='linear',
                 margin_autoexpand=True,
                 yaxis_automargin=True,
                 xaxis_automargin=True,
                 margin_t=tmargin, margin_b=bmargin, 
                 margin_l=lmargin, margin_r=rmargin,
             )
-            st.plotly_chart(fig, use_container_width=False, theme=None, config=save_config)
+            send_chart(fig, save_config)
 
             st.divider()
             
@@ -163,19 +160,38 @@ if file_uploaded is not None:
                 horizontal=True,
             )
             
-            pio.write_image(fig, f'tmp.{ext}', scale=1 if ext=='svg' else 3)
-            with open(f'tmp.{ext}', 'rb') as file:
+            fonts = svg_font_option(ext)
+            # 只有点击下载时才渲染图片
+            if facet_export_option(facet):
                 st.download_button(
-                    f'下载图片({ext}格式)', data = file,
-                    file_name=f'{options[trend_type]}.{ext}',               
+                    f'下载各分面图片({ext}格式，ZIP压缩包)',
+                    data=timed('export', partial(export_facets, fig, ext, width, height,
+                                                 fonts=fonts),
+                               format='zip'),
+                    file_name=f'{options[trend_type]}.zip',
+                    mime='application/zip',)
+            else:
+                st.download_button(
+                    f'下载图片({ext}格式)',
+                    data=timed('export', partial(export_image, fig, ext, scale=1 if ext=='svg' else 3,
+                                                 fonts=fonts),
+                               format=ext),
+                    file_name=f'{options[trend_type]}.{ext}',
                     mime=f'image/{ext}',)
+            bundle_button(options[trend_type], fig)
 
 
 st.divider()
 
-with st.expander('##### 数据格式示例（👈点此查看上传数据格式）'):
-    st.markdown('* 单类别趋势')
-    st.dataframe(df['single_trend'], use_container_width=True, hide_index=True)
+# 示例数据只在展开时才读取
+example = st.expander('##### 数据格式示例（👈点此查看上传数据格式）', on_change='rerun')
+if example.open:
+    with example:
+        st.markdown('* 单类别趋势')
+        st.dataframe(df['single_trend'], use_container_width=True, hide_index=True)
+
+        st.markdown('* 多类别趋势')
+        st.dataframe(df['multi_trend'], use_container_width=True, hide_index=True)
 
-    st.markdown('* 多类别趋势')
-    st.dataframe(df['multi_trend'], use_container_width=True, hide_index=True)
\ No newline at end of file
+bundle_panel()
+finish_run()
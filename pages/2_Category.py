@@ -1,17 +1,22 @@
+from functools import partial
+
 import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
 import plotly.io as pio
 
-from config import config
-from config.config import blue, red, df
+from config.config import df
+from config.ui import (
+    UPLOAD_TYPES, UPLOAD_HELP, load_upload, record_table, begin_run, finish_run,
+    svg_font_option, send_chart, bundle_button, bundle_panel,
+)
+from config.timing import timed
+from config.export import export_image
+from charts import pie, treemap, sunburst, waterfall, dualbar
 
 st.set_page_config(
     page_title='构成类绘图', page_icon='📊',
     layout='wide'
 )
+begin_run('构成类绘图')
 
 pio.templates.default = 'plotly_white+mytheme'
 
@@ -29,7 +34,7 @@ st.markdown("**注意**：上传的数据格式请参照后面的示例，总体
 
 
 file_uploaded = st.file_uploader(
-    '**上传CSV数据文件**', type=['csv', 'xlsx', 'xls'], help='上传CSV或excel文件格式的数据文件，其他格式数据暂不支持')
+    '**上传数据文件**', type=UPLOAD_TYPES, help=UPLOAD_HELP)
 
 sheet_select = st.empty()
 
@@ -70,132 +75,6 @@ save_config = {
 }
 
 
-def pie(data, values, names, insidelabel=False, is_hole=False,
-        width=width, height=height):
-    fig = px.pie(data, values=values, names=names, width=width, height=height)
-    fig.update_traces(
-        direction='clockwise',
-        textfont_family=config.font, textfont_size=config.size-2,
-    )
-    if insidelabel:
-        fig.update_traces(
-            textposition='inside', textinfo='percent+label',
-            showlegend=False,)
-    if is_hole:
-        fig.update_traces(hole=0.4)
-    return fig
-
-
-def treemap(data, path, values, color, labels=None, width=width, height=height):
-    fig = px.treemap(data, path=path, values=values, color=color,
-                     width=width, height=height)
-    if labels is not None:
-        fig.update_traces(
-            textinfo='+'.join(labels)
-        )
-    return fig
-
-
-def sunburst(data, path, values, color, labels=None, width=width, height=height):
-    fig = px.sunburst(data, path=path, values=values, color=color,
-                      width=width, height=height)
-    if labels is not None:
-        fig.update_traces(
-            textinfo='+'.join(labels)
-        )
-    return fig
-
-
-def waterfall(data, x, y, color, font_color):
-    fig = go.Figure()
-    fig.add_trace(go.Waterfall(
-        orientation='v', 
-        x=data[x], y=[v if i==0 else -v for i, v in enumerate(data[y])],
-        measure=['absolute'] + ['relative']*(len(data[y])-1),
-        text=[f'{i:.0f}' for i in data[y]], textposition='auto',
-        totals_marker_color=color,
-        decreasing_marker_color=color,
-        textfont_color=font_color,
-        textfont_family=config.font, textfont_size=config.size-2,
-    ))
-    fig.update_layout(
-        yaxis_title_text=y,
-    )
-    return fig
-
-
-def dualbar(df, x, y, cat, space=50, autorange=None, width=width, height=height):
-    cat_data = np.unique(df[cat])
-    left_cat = df[cat] == cat_data[0]
-    right_cat = df[cat] == cat_data[1]
-
-    left_data = df.loc[left_cat, :]
-    right_data = df.loc[right_cat, :]
-
-    size = len(left_data[x])
-
-    fig = go.Figure(data=[
-        # go.Bar(
-        #     x=[space]*size, y=left_data[y], 
-        #     marker_color='white', marker_line_color='white',
-        #     orientation='h', showlegend=False,
-        # ),
-        go.Bar(
-            name=cat_data[0], x=left_data[x], y=left_data[y], 
-            orientation='h', base=[space]*size,
-            text=left_data[x], textposition='outside',
-            textfont_family=config.font, textfont_size=config.size-2,
-        ),
-        # go.Bar(
-        #     x=[-space]*size, y=right_data[y], 
-        #     marker_color='white', marker_line_color='white',
-        #     orientation='h', showlegend=False,
-        # ),
-        go.Bar(
-            name=cat_data[1], x=-right_data[x], y=right_data[y], 
-            orientation='h', base=[-space]*size,
-            text=right_data[x], textposition='outside',
-            textfont_family=config.font, textfont_size=config.size-2,
-        ),
-        
-        go.Scatter(
-            x=[0]*size, y=left_data[y],
-            mode='text', text=left_data[y],
-            showlegend=False,
-        ),
-    ])
-    # Change the bar mode
-    fig.update_layout(
-        barmode='relative',
-        xaxis=dict(
-            showgrid=False,
-            showline=False,
-            showticklabels=False,
-            automargin='height+top',
-            zeroline=False,
-        ),
-        yaxis=dict(
-            showgrid=False,
-            showline=False,
-            showticklabels=False,
-            autorange=autorange,
-        ),
-        paper_bgcolor='white',
-        plot_bgcolor='white',
-        width=width, height=height,
-    )
-
-    fig.add_annotation(
-        x=1, y=1.1, 
-        xref='x domain', yref='y domain',
-        text=x,
-        showarrow=False,
-        font_family=config.font, font_size=config.size-2,
-        # align='right', valign='bottom',
-    )
-    return fig
-
-
 category_plot = {
     'pie_plot': pie,
     'tree_plot': treemap,
@@ -205,22 +84,9 @@ category_plot = {
 }
 
 if file_uploaded is not None:
-    try:
-        data = pd.read_csv(file_uploaded)
-    except:
-        xl = pd.ExcelFile(file_uploaded)
-        sheet = sheet_select.selectbox(
-            '🧾**读取哪一个工作表？**', options=xl.sheet_names,
-            index=0, help='默认选中第一个工作表'
-        )
-        data = xl.parse(sheet)
-    with data_display.container():
-        st.markdown('读取数据前3行展示：')
-        st.dataframe(data.head(3), use_container_width=True, hide_index=True)
-
-    columns = data.columns
-
-    # st.write(data)
+    source = record_table(load_upload(file_uploaded, sheet_select, data_display))
+
+    columns = source.columns
 
     fig = None
 
@@ -240,8 +106,9 @@ if file_uploaded is not None:
                 is_hole = st.checkbox('显示为圆环图')
         
             if values and names:
+                data = source.frame([names[0], values[0]])
                 fig = pie(data, values[0], names[0], insidelabel, is_hole, width=width, height=height)
-                st.plotly_chart(fig, use_container_width=False, theme=None, config=save_config)
+                send_chart(fig, save_config)
 
         elif cat_type == 'tree_plot' or cat_type == 'sunburst_plot':
             label_map = {
@@ -274,13 +141,27 @@ if file_uploaded is not None:
                 default=['label'], placeholder='显示的标签内容...',
                 format_func=lambda x: label_map[x],
             )
-            
+
+            depthcol, thresholdcol = st.columns(2)
+            maxdepth = depthcol.number_input(
+                '显示层级数', min_value=0, max_value=None, value=0, step=1,
+                help='只显示前若干级分支，更深层级的数值累加到上级分支；为0时显示全部层级',
+            )
+            threshold = thresholdcol.number_input(
+                '小类合并阈值(%)', min_value=0.0, max_value=100.0, value=0.0,
+                step=0.5, format='%.1f',
+                help='同一上级分支中占比低于该阈值的多个分支合并为一个“其他”分支，层级很多时可以保持图表清晰流畅',
+            )
+
             if path and values and color:
                 if not labels:
                     labels = ['label']
-                    
+
+                data = source.frame([*path, values[0], color[0]])
                 fig = category_plot[cat_type](
-                    data, path, values[0], color[0], labels
+                    data, path, values[0], color[0], labels,
+                    maxdepth=maxdepth or None, threshold=threshold/100,
+                    width=width, height=height,
                 )
                 fig.update_layout(
                     margin_autoexpand=True,
@@ -289,7 +170,7 @@ if file_uploaded is not None:
                     margin_t=tmargin, margin_b=bmargin, 
                     margin_l=lmargin, margin_r=rmargin,
                 )
-                st.plotly_chart(fig, use_container_width=False, theme=None, config=save_config)
+                send_chart(fig, save_config)
 
         elif cat_type == 'waterfall_plot':
             xcol, ycol = st.columns(2)
@@ -309,6 +190,7 @@ if file_uploaded is not None:
             font_color = fontcolorcol.color_picker('标签颜色', '#FFFFFF')
 
             if x and y:
+                data = source.frame([x[0], y[0]])
                 fig = waterfall(data, x[0], y[0], color, font_color)
                 fig.update_layout(
                     plot_bgcolor='white',
@@ -318,7 +200,7 @@ if file_uploaded is not None:
                     margin_t=tmargin, margin_b=bmargin, 
                     margin_l=lmargin, margin_r=rmargin,
                 )
-                st.plotly_chart(fig, use_container_width=False, theme=None, config=save_config)
+                send_chart(fig, save_config)
 
         elif cat_type == 'dualbar_plot':
             xcol, ycol, catcol = st.columns(3)
@@ -348,6 +230,7 @@ if file_uploaded is not None:
                 autorange = True
 
             if x and y and cat:
+                data = source.frame([x[0], y[0], cat[0]])
                 fig = dualbar(data, x[0], y[0], cat[0], space, autorange, width=width, height=height)
                 fig.update_layout(
                     plot_bgcolor='white',
@@ -357,7 +240,7 @@ if file_uploaded is not None:
                     margin_t=tmargin, margin_b=bmargin, 
                     margin_l=lmargin, margin_r=rmargin,
                 )
-                st.plotly_chart(fig, use_container_width=False, theme=None, config=save_config)
+                send_chart(fig, save_config)
 
         st.divider()
 
@@ -369,28 +252,37 @@ if file_uploaded is not None:
                 horizontal=True,
             )
             
-            pio.write_image(fig, f'tmp.{ext}', scale=1 if ext=='svg' else 3)
-            with open(f'tmp.{ext}', 'rb') as file:
-                st.download_button(
-                    f'下载图片({ext}格式)', data = file,
-                    file_name=f'{options[cat_type]}.{ext}',               
-                    mime=f'image/{ext}',)
+            fonts = svg_font_option(ext)
+            # 只有点击下载时才渲染图片
+            st.download_button(
+                f'下载图片({ext}格式)',
+                data=timed('export', partial(export_image, fig, ext, scale=1 if ext=='svg' else 3,
+                                             fonts=fonts),
+                           format=ext),
+                file_name=f'{options[cat_type]}.{ext}',
+                mime=f'image/{ext}',)
+            bundle_button(options[cat_type], fig)
 
 
 st.divider()
 
-with st.expander('##### 数据格式示例（👈点此查看上传数据格式）'):
-    st.markdown('* 饼图/圆环图')
-    st.dataframe(df['pie'], use_container_width=True, hide_index=True)
+# 示例数据只在展开时才读取
+example = st.expander('##### 数据格式示例（👈点此查看上传数据格式）', on_change='rerun')
+if example.open:
+    with example:
+        st.markdown('* 饼图/圆环图')
+        st.dataframe(df['pie'], use_container_width=True, hide_index=True)
 
-    st.markdown('* 树形图或多环图')
-    st.dataframe(df['treemap'], use_container_width=True, hide_index=True)
+        st.markdown('* 树形图或多环图')
+        st.dataframe(df['treemap'], use_container_width=True, hide_index=True)
 
-    st.markdown('* 瀑布图')
-    st.markdown('瀑布图的第一行为总量，之后的各行表示各构成部分的数量，保证之后各行的数值之和等于'
-                '第一行的值')
-    st.dataframe(df['waterfall'], use_container_width=True, hide_index=True)
+        st.markdown('* 瀑布图')
+        st.markdown('瀑布图的第一行为总量，之后的各行表示各构成部分的数量，保证之后各行的数值之和等于'
+                    '第一行的值')
+        st.dataframe(df['waterfall'], use_container_width=True, hide_index=True)
 
-    st.markdown('* 比较条形图')
-    st.dataframe(df['dualbar'], use_container_width=True, hide_index=True)
+        st.markdown('* 比较条形图')
+        st.dataframe(df['dualbar'], use_container_width=True, hide_index=True)
 
+bundle_panel()
+finish_run()
@@ -1,17 +1,25 @@
+from functools import partial
+
 import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
 import plotly.io as pio
 
 from config import config
-from config.config import blue, red, df
+from config.config import df
+from config.ui import (
+    UPLOAD_TYPES, UPLOAD_HELP, load_upload, record_table, begin_run, finish_run,
+    svg_font_option, send_chart, bundle_button, bundle_panel,
+    facet_option, facet_count, facet_export_option, name_table,
+)
+from config.timing import timed
+from config.export import export_image
+from charts import bar_rank, rank_table, style_rank_axes
+from charts.facet import facet_height, export_facets
 
 st.set_page_config(
     page_title='排名类绘图', page_icon='📊',
     layout='wide'
 )
+begin_run('排名类绘图')
 
 pio.templates.default = 'plotly_white+mytheme'
 
@@ -26,7 +34,7 @@ st.markdown("**注意**：上传的数据格式请参照后面的示例，总体
 
 
 file_uploaded = st.file_uploader(
-    '**上传CSV数据文件**', type=['csv', 'xlsx', 'xls'], help='上传CSV或excel文件格式的数据文件，其他格式数据暂不支持')
+    '**上传数据文件**', type=UPLOAD_TYPES, help=UPLOAD_HELP)
 
 sheet_select = st.empty()
 
@@ -65,59 +73,14 @@ save_config = {
   }
 }
 
-def bar_rank(data, x, y, barmode='relative', is_vertical=False,
-              width=width, height=0.618*width):
-    # orientation = 'v' if is_vertical else 'h'
-    fig = px.bar(data, x=x, y=y, #text=y if is_vertical else x,
-                #  orientation=orientation,
-                width=width, height=height)
-
-    if isinstance(y, str) and isinstance(x, str):
-        fig.update_traces(
-            text=data[y] if is_vertical else data[x],
-        )
-    else:
-        for c in (y if is_vertical else x):
-            fig.update_traces(
-                text=data[c], selector=dict(name=c)
-            )
-    fig.update_traces(
-        textposition='inside' if barmode=='relative' else 'outside',
-        textfont_family=config.font, textfont_size=config.size-2,
-    )
-    fig.update_layout(
-        barmode=barmode,
-        xaxis=dict(
-            showgrid=False,
-            showline=False,
-        ),
-        yaxis=dict(
-            showgrid=False,
-            showline=False,
-        ),
-    )
-
-    return fig
-
 rank = {
     'bar_plot': bar_rank,
 }
 
 if file_uploaded is not None:
-    try:
-        data = pd.read_csv(file_uploaded)
-    except:
-        xl = pd.ExcelFile(file_uploaded)
-        sheet = sheet_select.selectbox(
-            '🧾**读取哪一个工作表？**', options=xl.sheet_names,
-            index=0, help='默认选中第一个工作表'
-        )
-        data = xl.parse(sheet)
-    with data_display.container():
-        st.markdown('读取数据前3行展示：')
-        st.dataframe(data.head(3), use_container_width=True, hide_index=True)
+    source = record_table(load_upload(file_uploaded, sheet_select, data_display))
 
-    columns = data.columns
+    columns = source.columns
 
     fig = None
 
@@ -134,7 +97,7 @@ if file_uploaded is not None:
             max_selections=1,
         )
         color = colorcol.multiselect(
-            '颜色数据*' if data.shape[1]>2 else '颜色数据', 
+            '颜色数据*' if len(columns)>2 else '颜色数据', 
             options=columns,
             placeholder='颜色对应的数据...',
             max_selections=1,
@@ -143,8 +106,25 @@ if file_uploaded is not None:
         with vcol.container():
             is_vertical = st.checkbox('以柱状图展示排名')
             reverse_axis = st.checkbox('排名反序')
+
+        topcol, otherscol, namecol = st.columns(3)
+        top = topcol.number_input(
+            '显示前N名', min_value=0, max_value=None, value=0, step=5,
+            help='按数值总和只保留前N名，0表示显示全部类别',
+        )
+        others = otherscol.checkbox(
+            '其余类别合并为“其他”',
+            help='把前N名以外的类别合并为一个“其他”类别，显示在排名最后',
+        )
+        normalize = namecol.checkbox(
+            '申请人名称归一化',
+            help=('合并同一申请人的不同写法（全角半角、大小写、标点、公司后缀和相近的写法），'
+                  f'名称对应表保存在{config.name_map}，之后的上传直接沿用，也可以直接编辑该文件'),
+        )
+        facet, facet_cols = facet_option(columns)
         
-        if x and y and (not (data.shape[1]>2) or color):
+        # 分面列之外还有其他列时颜色数据必选
+        if x and y and (not (len(columns) > (3 if facet else 2)) or color):
             # if is_vertical:
             #     x, y = y, x
             if rank_type == 'bar_plot':
@@ -155,17 +135,21 @@ if file_uploaded is not None:
                     horizontal=True,
                 )
 
-                if data.shape[1] == 2:
-                    data = data.sort_values(by=y)
-                    yval = y[0] if is_vertical else x[0]
-                    xval = x[0] if is_vertical else y[0]
-                elif data.shape[1] > 2:
-                    data = data.pivot(index=x[0], columns=color[0], values=y[0])
-                    data = data.sort_values(by=data.columns[0]).reset_index()
-                    yval = data.columns[1:] if is_vertical else data.columns[0]
-                    xval = data.columns[0] if is_vertical else data.columns[1:]
-
-                fig = rank[rank_type](data, xval, yval, barmode, is_vertical, width, height)
+                c = color[0] if color and len(columns) > 2 else None
+                data = source.frame([x[0], y[0], c, facet])
+                if normalize:
+                    data, merged = name_table(source, data, x[0], y[0])
+                    st.caption(f'名称归一化合并了{merged}个名称写法')
+                fig_height = height
+                if facet is not None:
+                    fig_height = facet_height(facet_count(data, facet), facet_cols, height)
+                data, xval, yval = rank_table(
+                    data, x[0], y[0], c, is_vertical, top=top, others=others, facet=facet,
+                )
+
+                fig = rank[rank_type](data, xval, yval, barmode, is_vertical,
+                                      facet=facet, facet_cols=facet_cols,
+                                      width=width, height=fig_height)
   
                 fig.update_layout(
                     plot_bgcolor='white',
@@ -176,22 +160,8 @@ if file_uploaded is not None:
                     margin_t=tmargin, margin_b=bmargin, 
                     margin_l=lmargin, margin_r=rmargin,
                 )
-                
-                if is_vertical:
-                    fig.update_layout(
-                        xaxis_autorange='reversed' if reverse_axis else True,
-                        yaxis_showticklabels=False,
-                        xaxis_title_text='',
-                        yaxis_title_text=y[0],
-                    )
-                else:
-                    fig.update_layout(
-                        yaxis_autorange='reversed' if reverse_axis else True,
-                        xaxis_showticklabels=False,
-                        yaxis_title_text='',
-                        xaxis_title_text=y[0],
-                    )
-                st.plotly_chart(fig, use_container_width=False, theme=None, config=save_config)
+                style_rank_axes(fig, is_vertical, reverse_axis, y[0])
+                send_chart(fig, save_config)
 
             st.divider()
 
@@ -203,19 +173,38 @@ if file_uploaded is not None:
                     horizontal=True,
                 )
                 
-                pio.write_image(fig, f'tmp.{ext}', scale=1 if ext=='svg' else 3)
-                with open(f'tmp.{ext}', 'rb') as file:
+                fonts = svg_font_option(ext)
+                # 只有点击下载时才渲染图片
+                if facet_export_option(facet):
+                    st.download_button(
+                        f'下载各分面图片({ext}格式，ZIP压缩包)',
+                        data=timed('export', partial(export_facets, fig, ext, width, height,
+                                                     fonts=fonts),
+                                   format='zip'),
+                        file_name=f'{options[rank_type]}.zip',
+                        mime='application/zip',)
+                else:
                     st.download_button(
-                        f'下载图片({ext}格式)', data = file,
-                        file_name=f'{options[rank_type]}.{ext}',               
+                        f'下载图片({ext}格式)',
+                        data=timed('export', partial(export_image, fig, ext, scale=1 if ext=='svg' else 3,
+                                                     fonts=fonts),
+                                   format=ext),
+                        file_name=f'{options[rank_type]}.{ext}',
                         mime=f'image/{ext}',)
+                bundle_button(options[rank_type], fig)
 
 
 st.divider()
 
-with st.expander('##### 数据格式示例（👈点此查看上传数据格式）'):
-    st.markdown('* 单项目排名类')
-    st.dataframe(df['rank_single'], use_container_width=True, hide_index=True)
+# 示例数据只在展开时才读取
+example = st.expander('##### 数据格式示例（👈点此查看上传数据格式）', on_change='rerun')
+if example.open:
+    with example:
+        st.markdown('* 单项目排名类')
+        st.dataframe(df['rank_single'], use_container_width=True, hide_index=True)
+
+        st.markdown('* 多项目排名类')
+        st.dataframe(df['rank_multi'], use_container_width=True, hide_index=True)
 
-    st.markdown('* 多项目排名类')
-    st.dataframe(df['rank_multi'], use_container_width=True, hide_index=True)
\ No newline at end of file
+bundle_panel()
+finish_run()
@@ -1,26 +1,23 @@
-import streamlit as st
-import numpy as np
-import pandas as pd
+from functools import partial
 
-import plotly.express as px
-import plotly.graph_objects as go
+import streamlit as st
 import plotly.io as pio
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-import matplotlib.collections as mcollections
-from matplotlib.font_manager import FontProperties
-
 from config import config
-from config.config import blue, red, df
-
-import os
-cwd = os.getcwd()
+from config.config import df
+from config.ui import (
+    UPLOAD_TYPES, UPLOAD_HELP, load_upload, begin_run, finish_run,
+    svg_font_option, send_chart, bundle_button, bundle_panel,
+)
+from config.timing import stage, timed
+from config.export import export_image, savefig_bytes
+from charts import scatter_plot, melt_bubble, bubble_orders, scatter_pie, sankey
 
 st.set_page_config(
     page_title='实用图表', page_icon='📊',
     layout='wide'
 )
+begin_run('实用图表')
 
 pio.templates.default = 'plotly_white+mytheme'
 
@@ -36,7 +33,7 @@ st.markdown("**注意**：气泡图和桑基图的数据格式都采用“宽”
 
 
 file_uploaded = st.file_uploader(
-    '**上传CSV数据文件**', type=['csv', 'xlsx', 'xls'], help='上传CSV或excel文件格式的数据文件，其他格式数据暂不支持')
+    '**上传数据文件**', type=UPLOAD_TYPES, help=UPLOAD_HELP)
 
 sheet_select = st.empty()
 
@@ -77,128 +74,6 @@ save_config = {
 }
 
 
-# Plotting functions
-
-def scatter_plot(data, x, y, size, showlabel=True, size_max=55, 
-                width=width, height=height):
-# 长数据格式
-    fig = px.scatter(
-        data, x=x, y=y, size=size, 
-        size_max=size_max, text=size,
-        width=width, height=height,
-    )
-    fig.update_traces(
-        marker_line=dict(
-            color='#1A29FA',
-            width=2,
-        ),
-        mode='markers+text' if showlabel else 'markers',
-        marker_sizemode='area',
-    )
-    return fig
-
-
-def scatter_pie(data, x, y, cat, colors=px.colors.qualitative.Plotly,
-                rscale=1.4, xscale=3.5, yscale=2, showlabel=True,
-                width=width, height=height):
-    # 长宽混合数据格式
-    # plt.rcParams['font.sans-serif'] = ['SimHei']  # 用来正常显示中文标签
-    plt.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
-    font=FontProperties(fname=f'{cwd}/font/simhei.ttf')
-
-    dpi = plt.rcParams['figure.dpi']
-    pie_seg = np.unique(data[cat])
-    data = data.set_index(keys=[x, cat])
-    rows = np.unique([idx[0] for idx in data.index])
-    cols = y
-    colors = dict(zip(pie_seg, colors))
-
-    grouped_data = data.groupby(level=0).sum()
-    maximum = grouped_data.max().max()
-    minimum = grouped_data.min().min()
-
-    fig, ax = plt.subplots(figsize=(width/dpi, height/dpi))
-    handles = None
-    for i in range(len(rows)):
-        for j in range(len(cols)):
-            tmp_data = data.loc[rows[i], cols[j]]
-            c = []
-            for idx in tmp_data.index:
-                c.append(colors[idx])
-            r = np.sqrt(tmp_data.sum()) / np.sqrt(maximum)
-            if r:
-                wedges, *_ = ax.pie(
-                    tmp_data, colors=c, radius=r*rscale,
-                    center=(i*xscale, j*yscale), 
-                    startangle=90, frame=True,
-                )
-            if tmp_data.all():
-                handles = wedges
-
-            if showlabel and tmp_data.sum():
-                ax.text(i*xscale, j*yscale, f'{tmp_data.sum()}', 
-                        ha='center', va='center',
-                        fontproperties=font,)
-
-    ax.grid(True)
-    ax.yaxis.set_zorder(0)
-    ax.xaxis.set_zorder(0)
-    ax.set_xticks([i*xscale for i in range(len(rows))], labels=rows, fontproperties=font)
-    ax.set_yticks([j*yscale for j in range(len(cols))], labels=cols, fontproperties=font)
-
-    if handles is not None:
-        ax.legend(handles, pie_seg, loc='upper left', prop=font, 
-                  bbox_to_anchor=(1, 1), frameon=False)
-
-    return fig
-
-def hex2rgba(color, alpha=0.5):
-    r = int(color[1:3], 16)
-    g = int(color[3:5], 16)
-    b = int(color[5:7], 16)
-    return f'rgba({r},{g},{b},{alpha})'
-
-
-def sankey(data, colors=px.colors.qualitative.Plotly, showlinkcolor=False,
-           width=width, height=height):
-    outlabel = data.columns[0]
-    data = data.set_index(keys=outlabel)
-    label = list(data.index) + list(data.columns)
-    index_top9 = data.sum(axis=1).sort_values(ascending=False).index[:9]
-    colormap = dict(zip(index_top9, colors))
-    colors = [colormap.get(x, px.colors.qualitative.Plotly[-1]) for x in label]
-
-    row_num, col_num = data.shape
-    data.index = range(row_num)
-    data.columns = range(row_num, row_num+col_num)
-    data = data.reset_index().melt(
-        id_vars=['index'], value_vars=range(row_num, row_num+col_num)
-    )
-    data = data.query('value != 0')
-
-    source = data['index']
-    target = data['variable']
-    value = data['value']
-
-    colormap1 = dict(zip(index_top9[:5], px.colors.qualitative.Plotly))
-    link_colors = [hex2rgba(colormap1.get(label[i], '#AFAFAF')) for i in source]
-
-    fig = go.Figure(data=[go.Sankey(
-        node=dict(
-            pad=15, thickness=20, line=dict(color='black', width=0.5),
-            label=label, color=colors,
-        ),
-        link=dict(
-            source=source, target=target, value=value, 
-            color=link_colors if showlinkcolor else '#AFAFAF',
-        )
-    )])
-    fig.update_layout(
-        width=width, height=height,
-    )
-    return fig
-    
-
 utility = {
     'scatter_plot': scatter_plot,
     'scatter_pie': scatter_pie,
@@ -206,26 +81,15 @@ utility = {
 }
 
 if file_uploaded is not None:
-    try:
-        data = pd.read_csv(file_uploaded)
-    except:
-        xl = pd.ExcelFile(file_uploaded)
-        sheet = sheet_select.selectbox(
-            '🧾**读取哪一个工作表？**', options=xl.sheet_names,
-            index=0, help='默认选中第一个工作表'
-        )
-        data = xl.parse(sheet)
-    with data_display.container():
-        st.markdown('读取数据前3行展示：')
-        st.dataframe(data.head(3), use_container_width=True, hide_index=True)
-
-    columns = data.columns
+    source = load_upload(file_uploaded, sheet_select, data_display)
+
+    columns = source.columns
 
     fig = None
 
     with st.expander('##### 绘图区 (带*号为必选)', expanded=True):
         if utility_type == 'scatter_plot':
-            xcol, sizecol, showlabelcol = st.columns(3)
+            xcol, sizecol, showlabelcol, topkcol = st.columns(4)
             x = xcol.multiselect(
                 'X轴数据*', options=columns,
                 placeholder='X轴数据对应第1列...',
@@ -235,6 +99,11 @@ if file_uploaded is not None:
                 '气泡尺寸上限', min_value=10, max_value=None, step=5, value=55,
             )
             showlabel = showlabelcol.checkbox('显示数值标签')
+            label_top_k = topkcol.number_input(
+                '数值标签数量上限', min_value=1, max_value=None, step=50,
+                value=config.bubble_label_top_k,
+                help='只给数值最大的前若干个气泡显示数值标签，气泡很多时可以保持图表清晰流畅',
+            )
             y = st.multiselect(
                 'Y轴数据*', options=columns, 
                 placeholder='Y轴数据对应剩余列...',
@@ -242,10 +111,13 @@ if file_uploaded is not None:
             )
 
             if x and y:
-                data = data.melt(id_vars=x[0], value_vars=y)
+                data = source.frame([x[0], *y])
+                orders = bubble_orders(data, x[0], y)
+                data = melt_bubble(data, x[0], y)
                 fig = scatter_plot(
                     data, x=x[0], y='variable', size='value',
-                    showlabel=showlabel, size_max=size_max, 
+                    showlabel=showlabel, size_max=size_max,
+                    label_top_k=label_top_k, category_orders=orders,
                     width=width, height=height,
                 )
 
@@ -259,7 +131,7 @@ if file_uploaded is not None:
                     margin_t=tmargin, margin_b=bmargin, 
                     margin_l=lmargin, margin_r=rmargin,
                 )
-                st.plotly_chart(fig, use_container_width=False, theme=None, config=save_config)
+                send_chart(fig, save_config)
 
         elif utility_type == 'scatter_pie':
             xcol, catcol = st.columns(2)
@@ -294,28 +166,54 @@ if file_uploaded is not None:
             showlabel = showlabelcol.checkbox('显示数值标签')
 
             if x and y and cat:
-                fig = scatter_pie(
-                    data, x[0], y, cat[0], 
-                    rscale=rscale, xscale=xscale, yscale=yscale, showlabel=showlabel,
-                    width=width, height=height)
-                st.pyplot(fig, use_container_width=True)
+                # 气泡大小按全部数值列的最大值缩放，因此读取全部列
+                data = source.frame()
+                with stage('build', chart='scatter_pie'):
+                    fig = scatter_pie(
+                        data, x[0], y, cat[0], 
+                        rscale=rscale, xscale=xscale, yscale=yscale, showlabel=showlabel,
+                        width=width, height=height)
+                with stage('send'):
+                    st.pyplot(fig, use_container_width=True)
 
         elif utility_type == 'sankey_plot':
+            stagecol, valuecol, thresholdcol = st.columns(3)
+            stages = stagecol.multiselect(
+                '节点层级', options=columns,
+                placeholder='按顺序选择各级节点列...',
+                help=('“长”数据格式时按顺序选择2级或以上的节点列，例如优先权国家、申请人类型、'
+                      '目标市场；不选择时按“宽”数据格式绘制两级桑基图'),
+            )
+            value = valuecol.multiselect(
+                '流量数据', options=columns,
+                placeholder='流量对应的数据列...', max_selections=1,
+                help='“长”数据格式时有效，不选择时按记录条数计算流量',
+            )
+            threshold = thresholdcol.number_input(
+                '小流量合并阈值(%)', min_value=0.0, max_value=100.0, value=0.0,
+                step=0.5, format='%.1f',
+                help='每一级中流量占比低于该阈值的节点合并为一个“其他”节点，减少节点和连接数量',
+            )
             showlinkcolor = st.checkbox(
                 '连接显示颜色', 
                 help=('连接线条的颜色与左侧节点相同，具有一定透明度，并且只对左侧'
                       '前5位的输出节点连线赋予颜色,避免图片太繁杂'),
             )
-            fig = sankey(data, showlinkcolor=showlinkcolor,
-                        width=width, height=height)
-            fig.update_layout(
-                    margin_autoexpand=True,
-                    yaxis_automargin=True,
-                    xaxis_automargin=True,
-                    margin_t=tmargin, margin_b=bmargin, 
-                    margin_l=lmargin, margin_r=rmargin,
-                )
-            st.plotly_chart(fig, use_container_width=False, theme=None, config=save_config)
+            if len(stages) != 1:
+                # “宽”数据格式需要全部列
+                data = source.frame([*stages, *value] if stages else None)
+                fig = sankey(data, showlinkcolor=showlinkcolor,
+                             stages=stages or None, value=value[0] if value else None,
+                             threshold=threshold/100,
+                             width=width, height=height)
+                fig.update_layout(
+                        margin_autoexpand=True,
+                        yaxis_automargin=True,
+                        xaxis_automargin=True,
+                        margin_t=tmargin, margin_b=bmargin, 
+                        margin_l=lmargin, margin_r=rmargin,
+                    )
+                send_chart(fig, save_config)
         
         st.divider()
 
@@ -327,33 +225,43 @@ if file_uploaded is not None:
                 horizontal=True,
             )
 
+            # 只有点击下载时才渲染图片
             if utility_type == 'scatter_plot' or utility_type == 'sankey_plot':
-                pio.write_image(fig, f'tmp.{ext}', scale=1 if ext=='svg' else 3)
+                fonts = svg_font_option(ext)
+                image = partial(export_image, fig, ext, scale=1 if ext=='svg' else 3, fonts=fonts)
             elif utility_type == 'scatter_pie':
-                fig.savefig(f'tmp.{ext}', bbox_inches='tight', dpi=300)
+                image = partial(savefig_bytes, fig, ext, dpi=300)
 
-            with open(f'tmp.{ext}', 'rb') as file:
-                st.download_button(
-                    f'下载图片({ext}格式)', data = file,
-                    file_name=f'{options[utility_type]}.{ext}',               
-                    mime=f'image/{ext}',)
+            st.download_button(
+                f'下载图片({ext}格式)', data=timed('export', image, format=ext),
+                file_name=f'{options[utility_type]}.{ext}',
+                mime=f'image/{ext}',)
+            bundle_button(options[utility_type], fig)
 
 
 st.divider()
 
-with st.expander('##### 数据格式示例（👈点此查看上传数据格式）'):
-    st.markdown('* 单气泡图')
-    st.markdown('绘制单气泡图的数据格式中，第1列为X轴上的标签，剩余列的表头为Y轴上的标签，该数据为“宽”数据格式。')
-    st.dataframe(df['bubble'], use_container_width=True, hide_index=True)
-
-    st.markdown('* 饼状气泡图')
-    st.markdown('饼状气泡区可表示具有构成关系的两个以上区域或申请人在同一领域的技术功效图，'
-                '但通常构成对象数量**不建议超过3个**。绘制饼状气泡图的数据格式中，第1列为'
-                'X轴上的标签，第2列为饼状图的构成项目，前2列实际上为“长”数据格式；剩余列的'
-                '表头为Y轴上的标签, 其采用的“宽”数据格式，所以饼状气泡图的数据格式是混合数据格式。')
-    st.dataframe(df['bubble_pie'], use_container_width=True, hide_index=True)
-
-    st.markdown('* 桑基图')
-    st.markdown('左右两节点的桑基图用于表示技术输入输出，具体的数据格式中，第1列表示技术输出国'
-                '（来源国，即最早优先权国家），后面各列表示技术输入国（目标国，即同族中包括的国家）。')
-    st.dataframe(df['sankey'], use_container_width=True, hide_index=True)
+# 示例数据只在展开时才读取
+example = st.expander('##### 数据格式示例（👈点此查看上传数据格式）', on_change='rerun')
+if example.open:
+    with example:
+        st.markdown('* 单气泡图')
+        st.markdown('绘制单气泡图的数据格式中，第1列为X轴上的标签，剩余列的表头为Y轴上的标签，该数据为“宽”数据格式。')
+        st.dataframe(df['bubble'], use_container_width=True, hide_index=True)
+
+        st.markdown('* 饼状气泡图')
+        st.markdown('饼状气泡区可表示具有构成关系的两个以上区域或申请人在同一领域的技术功效图，'
+                    '但通常构成对象数量**不建议超过3个**。绘制饼状气泡图的数据格式中，第1列为'
+                    'X轴上的标签，第2列为饼状图的构成项目，前2列实际上为“长”数据格式；剩余列的'
+                    '表头为Y轴上的标签, 其采用的“宽”数据格式，所以饼状气泡图的数据格式是混合数据格式。')
+        st.dataframe(df['bubble_pie'], use_container_width=True, hide_index=True)
+
+        st.markdown('* 桑基图')
+        st.markdown('左右两节点的桑基图用于表示技术输入输出，具体的数据格式中，第1列表示技术输出国'
+                    '（来源国，即最早优先权国家），后面各列表示技术输入国（目标国，即同族中包括的国家）。'
+                    '多级桑基图采用“长”数据格式，每一列表示一级节点，每一行表示一条流量记录，'
+                    '在“节点层级”中按顺序选择各级节点列即可。')
+        st.dataframe(df['sankey'], use_container_width=True, hide_index=True)
+
+bundle_panel()
+finish_run()